@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import json
+import os
+from pathlib import Path, PurePosixPath
+import shutil
+import sys
+import tarfile
+from typing import BinaryIO, Optional, Union
+
+import DotManager.config as config
+from DotManager.commands.save import SaveInfo
+from DotManager.index import index
+import DotManager.trash as trash
+import DotManager.tools as tools
+
+COMPRESSIONS = ("", "gz", "xz", "bz2")
+""" Compressions supported by archives, "" meaning none. """
+
+_SUFFIXES = {".gz": "gz", ".tgz": "gz", ".xz": "xz", ".txz": "xz",
+             ".bz2": "bz2", ".tbz2": "bz2"}
+
+INDEX_MEMBER = "index.json"
+SAVED_MEMBER = "saved"
+
+
+def compression_for(path: Union[str, Path]) -> str:
+    """ Guess an archive's compression from its file name. """
+    return _SUFFIXES.get(Path(path).suffix, "")
+
+
+def select(app: Optional[str] = None,
+           name: Optional[str] = None,
+           user: Optional[str] = None) -> list[tuple[str, str, str]]:
+    """ List the saved configs matching a filter, as (user, app, name).
+
+        Filters left to None match anything.
+        """
+    return [(u, a, n)
+            for u, apps in sorted(index.__dict__.items())
+            if user in (None, u)
+            for a, names in sorted(apps.items())
+            if app in (None, a)
+            for n in names
+            if name in (None, n)]
+
+
+def export_archive(out: BinaryIO,
+                   configs: list[tuple[str, str, str]],
+                   compression: str = "",
+                   saveDir: Union[str, Path] = config.saveDir) -> int:
+    """ Write the given configs and their index entries as a tar stream.
+
+        The archive is written in stream mode, one block at a time, so
+        memory use doesn't depend on the size of the configs. Entries of the
+        index come first, in `index.json`, so that importing doesn't have to
+        look ahead. Files that are hardlinked together (e.g. through the
+        object store) are only stored once per config: each config holds
+        the content of its own files, so that it can be imported without
+        the others.
+
+        Returns the number of configs exported.
+        """
+    entries: dict[str, dict[str, list[str]]] = {}
+    for user, app, name in configs:
+        entries.setdefault(user, {}).setdefault(app, []).append(name)
+    data = json.dumps(entries, indent=4, sort_keys=True).encode()
+
+    with tarfile.open(fileobj=out, mode=f"w|{compression}") as tar:
+        member = tarfile.TarInfo(INDEX_MEMBER)
+        member.size = len(data)
+        tar.addfile(member, io.BytesIO(data))
+        for user, app, name in configs:
+            location = SaveInfo(app, name, user, saveDir).location
+            if not location.exists():
+                tools.eprint(f"Missing {location}, exported in the index only.")
+                continue
+            tar.inodes.clear()
+            tar.add(location, f"{SAVED_MEMBER}/{location.name}")
+    return len(configs)
+
+
+def _safe(member: tarfile.TarInfo) -> bool:
+    """ Refuse members that would land outside of where they're extracted.
+
+        Saves follow symlinks, so archives never hold any.
+        """
+    path = PurePosixPath(member.name)
+    if path.is_absolute() or ".." in path.parts:
+        return False
+    if member.islnk():
+        target = PurePosixPath(member.linkname)
+        return not target.is_absolute() and ".." not in target.parts
+    return member.isfile() or member.isdir()
+
+
+# Extraction filters are only available in recent Python versions
+_FILTER = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+
+def import_archive(src: BinaryIO,
+                   force: bool = False,
+                   saveDir: Union[str, Path] = config.saveDir) -> int:
+    """ Read a tar stream written by `export_archive` into `saveDir`.
+
+        Members are extracted as they come, without buffering the archive,
+        and the index is only updated once everything was extracted.
+        Configs that already exist are skipped, unless `force` is set, in
+        which case they are replaced, the existing ones going to the trash.
+        A hardlink is only extracted if what it links to was extracted
+        too, configs missing some of their content aren't imported.
+
+        Returns the number of configs imported.
+        """
+    saveDir = Path(saveDir)
+    saveDir.mkdir(parents=True, exist_ok=True)
+    configs: dict[str, tuple[str, str, str]] = {}
+    skipped: set[str] = set()
+    started: set[str] = set()
+    failed: set[str] = set()
+    # Files extracted so far, that hardlinks can point to
+    extracted: set[str] = set()
+
+    with tarfile.open(fileobj=src, mode="r|*") as tar:
+        for member in tar:
+            if member.name == INDEX_MEMBER:
+                f = tar.extractfile(member)
+                entries = json.load(f) if f is not None else {}
+                for user, apps in entries.items():
+                    for app, names in apps.items():
+                        for name in names:
+                            info = SaveInfo(app, name, user, saveDir)
+                            configs[info.location.name] = (user, app, name)
+                            if index.query(app, name, user) and not force:
+                                print(info._FileExists)
+                                print(info._Skip)
+                                skipped.add(info.location.name)
+                continue
+
+            parts = PurePosixPath(member.name).parts
+            if len(parts) < 2 or parts[0] != SAVED_MEMBER:
+                tools.eprint(f"Ignoring unexpected member {member.name}.")
+                continue
+            base = parts[1]
+            if base not in configs or base in skipped:
+                continue
+            if not _safe(member):
+                tools.eprint(f"Ignoring unsafe member {member.name}.")
+                continue
+            if base not in started:
+                started.add(base)
+                user, app, name = configs[base]
+                trash.move(saveDir.joinpath(base), user, app, name, saveDir)
+            # Members are relative to the archive root, saved/ included.
+            member.name = str(PurePosixPath(*parts[1:]))
+            if member.islnk():
+                member.linkname = str(
+                    PurePosixPath(*PurePosixPath(member.linkname).parts[1:]))
+                # Its content is in a config that was skipped, and linking
+                # to the file there would import whatever it holds now.
+                if member.linkname not in extracted:
+                    tools.eprint(f"Failed to extract {member.name}: its " +
+                                 "content is in a config that wasn't " +
+                                 "imported, export it again.")
+                    failed.add(base)
+                    continue
+            try:
+                tar.extract(member, saveDir, set_attrs=True, **_FILTER)
+            except (OSError, tarfile.TarError) as e:
+                tools.eprint(f"Failed to extract {member.name}: {e}")
+                continue
+            extracted.add(member.name)
+
+    imported = 0
+    for base, (user, app, name) in configs.items():
+        if base in skipped:
+            continue
+        if base in failed:
+            shutil.rmtree(saveDir.joinpath(base), ignore_errors=True)
+            index.remove(app, name, user)
+            continue
+        index.insert(app, name, user)
+        imported += 1
+    index.update()
+    return imported
+
+
+def open_output(path: Optional[str]) -> BinaryIO:
+    """ Open where to write an archive, "-" or None meaning stdout. """
+    if path in (None, "-"):
+        return sys.stdout.buffer
+    return open(path, 'wb')
+
+
+def open_input(path: Optional[str]) -> BinaryIO:
+    """ Open where to read an archive from, "-" or None meaning stdin. """
+    if path in (None, "-"):
+        return sys.stdin.buffer
+    return open(path, 'rb')
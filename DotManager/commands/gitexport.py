@@ -0,0 +1,300 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Export saved configs to a git repository through `git fast-import`. """
+
+import json
+import os
+from pathlib import Path
+import socket
+import stat
+import subprocess
+import time
+from typing import BinaryIO, Iterator, Optional, Union
+
+import DotManager.config as config
+from DotManager.commands.archive import INDEX_MEMBER, select
+from DotManager.commands.save import SaveInfo
+
+STATE = "dotmanager-export.json"
+""" What was last exported, kept in the repository's git dir. """
+
+MARKS = "dotmanager-export.marks"
+""" Marks of the blobs and commits exported so far, written by git. """
+
+_CHUNK = 1 << 20
+
+# (dev, ino, size, mtime_ns): files that didn't change keep all four, as saves
+# replace changed files rather than writing over them.
+_Key = tuple[int, int, int, int]
+
+
+def _git(*args: str, gitDir: Optional[Path] = None,
+         check: bool = True) -> subprocess.CompletedProcess:
+    """ Run git, returning what it printed on stdout. """
+    cmd = ["git"] + ([f"--git-dir={gitDir}"] if gitDir else []) + list(args)
+    return subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=check)
+
+
+def git_dir(repo: Union[str, Path]) -> Path:
+    """ Find the git dir of `repo`, creating a bare repository if needed. """
+    repo = Path(repo)
+    if not repo.exists():
+        _git("init", "--quiet", "--bare", str(repo))
+    out = _git("-C", str(repo), "rev-parse", "--absolute-git-dir").stdout
+    return Path(out.strip())
+
+
+def _quote(path: bytes) -> bytes:
+    """ Quote a path for fast-import when it can't be written as is. """
+    if b'\n' not in path and b'\\' not in path and not path.startswith(b'"'):
+        return path
+    escaped = (path.replace(b'\\', b'\\\\').replace(b'"', b'\\"')
+               .replace(b'\n', b'\\n'))
+    return b'"' + escaped + b'"'
+
+
+def _walk(location: Path) -> Iterator[tuple[str, os.stat_result]]:
+    """ Every regular file and symlink of a saved config, relative to the
+        directory holding it.
+        """
+    stack = [location]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif (entry.is_file(follow_symlinks=False)
+                      or entry.is_symlink()):
+                    rel = Path(entry.path).relative_to(location.parent)
+                    yield rel.as_posix(), entry.stat(follow_symlinks=False)
+
+
+def _mode(st: os.stat_result) -> int:
+    """ The mode git gives a file. """
+    if stat.S_ISLNK(st.st_mode):
+        return 0o120000
+    return 0o100755 if st.st_mode & stat.S_IXUSR else 0o100644
+
+
+def _blob(out: BinaryIO, mark: int, path: str, st: os.stat_result):
+    """ Write a file's content as a blob, exactly `st_size` bytes of it.
+
+        The content of a symlink is its target.
+        """
+    if stat.S_ISLNK(st.st_mode):
+        target = os.readlink(os.fsencode(path))
+        out.write(b"blob\nmark :%d\ndata %d\n%s\n"
+                  % (mark, len(target), target))
+        return
+    size = st.st_size
+    out.write(b"blob\nmark :%d\ndata %d\n" % (mark, size))
+    with open(path, 'rb') as f:
+        remaining = size
+        while remaining:
+            chunk = f.read(min(_CHUNK, remaining))
+            if not chunk:
+                raise OSError(f"{path} was truncated while being exported")
+            out.write(chunk)
+            remaining -= len(chunk)
+    out.write(b"\n")
+
+
+def _tip(ref: str, gitDir: Path) -> str:
+    """ The commit `ref` points to, "" if it doesn't exist. """
+    return _git("rev-parse", "--verify", "--quiet", ref + "^{commit}",
+                gitDir=gitDir, check=False).stdout.strip()
+
+
+def _marked(mark: int, marksPath: Path) -> str:
+    """ The object exported under `mark`, "" if git doesn't know it. """
+    try:
+        with open(marksPath) as f:
+            for line in f:
+                if line.startswith(f":{mark} "):
+                    return line.split()[1]
+    except OSError:
+        pass
+    return ""
+
+
+def _exported(tip: str, gitDir: Path) -> list[tuple[str, str, str]]:
+    """ The configs listed in the index of a commit, as (user, app, name). """
+    out = _git("cat-file", "blob", f"{tip}:{INDEX_MEMBER}", gitDir=gitDir,
+               check=False).stdout
+    try:
+        entries = json.loads(out)
+        return [(u, a, n) for u, apps in entries.items()
+                for a, names in apps.items() for n in names]
+    except (ValueError, AttributeError, TypeError):
+        return []
+
+
+def _committer() -> bytes:
+    """ Who and when, in the raw format fast-import expects. """
+    offset = time.localtime().tm_gmtoff // 60
+    sign = "-" if offset < 0 else "+"
+    offset = abs(offset)
+    who = f"{config.userName} <{config.userName}@{socket.gethostname()}>"
+    return (f"{who} {int(time.time())} "
+            f"{sign}{offset // 60:02d}{offset % 60:02d}").encode()
+
+
+def export_git(repo: Union[str, Path],
+               app: Optional[str] = None,
+               name: Optional[str] = None,
+               user: Optional[str] = None,
+               saveDir: Union[str, Path] = config.saveDir) -> tuple[int, int]:
+    """ Commit the saved configs matching a filter to a git repository.
+
+        The commit is written as a `git fast-import` stream rather than
+        through a working tree, on the branch HEAD points to, with each
+        config in a directory named after its location and the index of
+        exported configs in `index.json`. A bare repository is created if
+        `repo` doesn't exist.
+
+        Exports are incremental: the state of every exported file is kept in
+        the git dir, and only files that changed since are sent, on top of
+        the last exported commit. Blobs are marked, so files hardlinked
+        together, through the object store or across exports, are only sent
+        once. If the branch moved since, the selected configs are exported
+        again from scratch, on top of it: their directories are replaced,
+        the configs listed in its `index.json` are kept, and so is anything
+        else on the branch. Nothing is committed when nothing changed.
+
+        Returns the number of configs exported and of files that changed.
+        """
+    saveDir = Path(saveDir)
+    gitDir = git_dir(repo)
+    statePath = gitDir.joinpath(STATE)
+    marksPath = gitDir.joinpath(MARKS)
+    head = _git("symbolic-ref", "HEAD", gitDir=gitDir).stdout.strip()
+
+    try:
+        with open(statePath) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    tip = _tip(head, gitDir)
+    incremental = (bool(tip) and state.get("ref") == head
+                   and _marked(state.get("commit", 0), marksPath) == tip)
+    if not incremental:
+        state = {}
+        marksPath.unlink(missing_ok=True)
+
+    selected = select(app, name, user)
+    previous = [tuple(c) for c in state.get("configs", [])]
+    if not incremental and tip:
+        previous = _exported(tip, gitDir)
+    # Configs that match the filter but weren't selected were removed.
+    removed = {(u, a, n) for u, a, n in previous
+               if user in (None, u) and app in (None, a)
+               and name in (None, n)} - set(selected)
+    configs = sorted(set(selected) | set(previous) - removed)
+    files: dict[str, list[int]] = state.get("files", {})
+    known: dict[_Key, int] = {tuple(e[:4]): e[5] for e in files.values()}
+    lastMark: int = state.get("mark", 0)
+
+    # Files of the selected configs are walked again, those of other configs
+    # are left as they were exported.
+    bases = {SaveInfo(a, n, u, saveDir).location.name + "/"
+             for u, a, n in set(selected) | removed}
+    stale = {path for path in files if path[:path.find("/") + 1] in bases}
+    # Without a state to tell which files they had, directories are replaced
+    if not incremental and tip:
+        stale = {base[:-1] for base in bases}
+
+    proc = subprocess.Popen(["git", f"--git-dir={gitDir}", "fast-import",
+                             "--quiet", "--done",
+                             f"--import-marks-if-exists={marksPath}",
+                             f"--export-marks={marksPath}"],
+                            stdin=subprocess.PIPE)
+    assert proc.stdin is not None
+    out = proc.stdin
+    changes: list[bytes] = []
+    try:
+        for u, a, n in selected:
+            location = SaveInfo(a, n, u, saveDir).location
+            if not location.is_dir():
+                continue
+            for path, st in _walk(location):
+                stale.discard(path)
+                key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+                mode = _mode(st)
+                entry = files.get(path)
+                if entry and tuple(entry[:5]) == key + (mode,):
+                    continue
+                mark = known.get(key)
+                if mark is None:
+                    lastMark += 1
+                    mark = known[key] = lastMark
+                    _blob(out, mark, str(saveDir.joinpath(path)), st)
+                files[path] = list(key) + [mode, mark]
+                changes.append(b"M %o :%d %s\n"
+                               % (mode, mark, _quote(os.fsencode(path))))
+        deletes = []
+        for path in sorted(stale):
+            files.pop(path, None)
+            deletes.append(b"D %s\n" % _quote(os.fsencode(path)))
+        # Directories are deleted before their files are written again
+        changes[:0] = deletes
+
+        entries: dict[str, dict[str, list[str]]] = {}
+        for u, a, n in configs:
+            entries.setdefault(u, {}).setdefault(a, []).append(n)
+        if changes or entries != state.get("index", {}):
+            data = json.dumps(entries, indent=4, sort_keys=True).encode()
+            changes.append(b"M 100644 inline %s\ndata %d\n%s\n"
+                           % (INDEX_MEMBER.encode(), len(data), data))
+
+        if changes:
+            lastMark += 1
+            message = (f"Export {len(selected)} configs, "
+                       f"{len(changes) - 1} files changed\n").encode()
+            out.write(b"commit %s\nmark :%d\ncommitter %s\ndata %d\n%s"
+                      % (head.encode(), lastMark, _committer(),
+                         len(message), message))
+            if tip:
+                out.write(b"from %s^0\n" % head.encode())
+            out.writelines(changes)
+            out.write(b"\n")
+        out.write(b"done\n")
+        out.close()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.wait():
+        raise subprocess.CalledProcessError(proc.returncode, "git fast-import")
+
+    if changes:
+        state = {"ref": head, "commit": lastMark, "mark": lastMark,
+                 "configs": [list(c) for c in configs], "index": entries,
+                 "files": files}
+        tmp = statePath.with_suffix(".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, statePath)
+    return len(selected), max(len(changes) - 1, 0)
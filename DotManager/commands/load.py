@@ -0,0 +1,303 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import os
+from pathlib import Path
+import shutil
+from stat import S_IMODE, S_ISDIR, S_ISLNK
+from typing import Iterator, Optional, Union
+
+import DotManager.config as config
+from DotManager.commands.save import SaveInfo
+from DotManager.copier import Copier
+from DotManager.index import index
+from DotManager.plan import Plan
+import DotManager.tools as tools
+
+MODES = ("symlink", "hardlink", "reflink", "copy")
+""" Ways to put a saved file in place, from lightest to heaviest. """
+
+# Errors meaning a mode can't work here, as opposed to actual failures.
+_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP,
+                errno.ENOTTY, errno.EINVAL, errno.ENOSYS}
+
+
+class Linker:
+    """ Puts saved files in place, using the lightest mode that works.
+
+        Starting from the requested mode, each file falls back to the next
+        one in `MODES` when the filesystem doesn't support it. A mode that
+        failed that way isn't tried again for the following files, except
+        when hardlinking fails because a file has too many links already.
+        """
+
+    def __init__(self, mode: str = "symlink"):
+        if mode not in MODES:
+            raise ValueError(f"Invalid load mode: '{mode}', " +
+                             f"must be one of {', '.join(MODES)}")
+        self.modes: list[str] = list(MODES[MODES.index(mode):])
+        self.stats: dict[str, int] = {}
+        # Reflinks are a mode of their own, copies are actual copies.
+        self.copier = Copier()
+        self.copier.disabled.add("reflink")
+
+    def place(self, src: Path, dst: Path, entry: dict) -> str:
+        """ Put `src` at `dst`, return the mode that was used. """
+        for mode in list(self.modes):
+            try:
+                getattr(self, "_" + mode)(src, dst, entry)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED or mode == "copy":
+                    raise
+                if e.errno != errno.EMLINK and mode in self.modes:
+                    self.modes.remove(mode)
+                continue
+            self.stats[mode] = self.stats.get(mode, 0) + 1
+            return mode
+        raise OSError(errno.ENOTSUP, "No load mode available", str(dst))
+
+    @staticmethod
+    def _symlink(src: Path, dst: Path, entry: dict):
+        os.symlink(os.path.abspath(src), dst)
+
+    @staticmethod
+    def _hardlink(src: Path, dst: Path, entry: dict):
+        os.link(src, dst)
+
+    @staticmethod
+    def _reflink(src: Path, dst: Path, entry: dict):
+        tools.reflink(src, dst)
+        Linker._restore(src, dst, entry)
+
+    def _copy(self, src: Path, dst: Path, entry: dict):
+        self.copier.copyfile(src, dst)
+        Linker._restore(src, dst, entry)
+
+    @staticmethod
+    def _restore(src: Path, dst: Path, entry: dict):
+        """ Give a copied file its original permissions and times back.
+
+            The manifest is authoritative, saved files may be shared blobs.
+            """
+        if "mode" in entry and "mtime" in entry:
+            os.chmod(dst, S_IMODE(entry["mode"]))
+            os.utime(dst, ns=(entry["mtime"], entry["mtime"]))
+        else:
+            shutil.copystat(src, dst)
+
+
+def _saved(app: str, name: str, user: str, saveDir: Union[str, Path],
+           generation: Optional[int] = None) -> SaveInfo:
+    """ The SaveInfo of a saved config, or of one of its generations. """
+    info = SaveInfo(app, name, user, saveDir)
+    if generation is not None and not info.use_generation(generation):
+        raise FileNotFoundError(errno.ENOENT, "No such generation",
+                                str(info.generation_dir(generation)))
+    return info
+
+
+def mode_for(info: SaveInfo, mode: Optional[str] = None) -> str:
+    """ The mode a saved config can actually be loaded with.
+
+        Files of a config saved in the object store are blobs, shared with
+        every other config that has the same content, and read-only. Linking
+        to them would keep users from editing their own files, or let them
+        change other configs.
+        Files of a config that keeps generations are shared with the
+        previous ones, and the current generation becomes a previous one on
+        the next save. Editing them through links would change what was
+        saved, and previous generations are eventually deleted.
+        Such configs are loaded as reflinks or copies instead.
+        Without a `mode`, that's symlink if `config.useLinks` allows it.
+        """
+    if mode is None:
+        mode = "symlink" if config.useLinks else "reflink"
+    if mode not in ("symlink", "hardlink"):
+        return mode
+    if (config.generations > 0 or info.read_dotmatch().get("store")
+            or info.location.parent == info.generations):
+        return "reflink"
+    return mode
+
+
+def entries(info: SaveInfo) -> Iterator[tuple[Path, Path, dict]]:
+    """ List what a saved config holds, as (saved, live, manifest entry).
+
+        Directories come before their content. Configs saved by older
+        versions don't have a manifest, so their directory is walked instead.
+        """
+    dotmatch = info.read_dotmatch()
+    files = dotmatch.get("files")
+    if isinstance(files, dict):
+        match: dict[str, str] = dotmatch.get("match", {})
+    else:
+        match = dotmatch
+        files = {}
+        for root in match:
+            src = info.location.joinpath(root)
+            try:
+                files[root] = {"mode": src.stat().st_mode}
+            except OSError:
+                continue
+            for rel, entry in tools.scantree(src, prefix=root):
+                files[rel] = {"mode": entry.stat().st_mode}
+    for rel in sorted(files):
+        root, _, rest = rel.partition(os.sep)
+        if root not in match:
+            continue
+        dst = tools.expandpath(match[root])
+        yield info.location.joinpath(rel), dst.joinpath(rest), files[rel]
+
+
+def _in_place(src: Path, dst: Path, entry: dict) -> Optional[bool]:
+    """ Check what's at `dst` already.
+
+        Returns None if there's nothing, True if it's what would be loaded
+        there, and False if loading would overwrite something else.
+        """
+    try:
+        st = os.lstat(dst)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if S_ISDIR(entry["mode"]):
+        return S_ISDIR(st.st_mode)
+    if S_ISLNK(st.st_mode):
+        return os.readlink(dst) == os.path.abspath(src)
+    if S_ISDIR(st.st_mode):
+        return False
+    if os.path.samestat(st, os.stat(src)):
+        return True
+    return (st.st_size == entry.get("size")
+            and st.st_mtime_ns == entry.get("mtime"))
+
+
+def plan(app: str,
+         name: str = "default",
+         user: str = config.userName,
+         saveDir: Union[str, Path] = config.saveDir,
+         mode: Optional[str] = None,
+         generation: Optional[int] = None) -> Plan:
+    """ Work out what loading a saved config would do, without writing.
+
+        Files that are already in place are skipped, and whatever is in the
+        way of the others is deleted first. Files are linked in symlink and
+        hardlink modes, and copied otherwise, though the actual mode may end
+        up being a heavier one if the filesystem doesn't support it.
+        With `generation`, a previous generation of the config is loaded.
+        Link modes are only used where `mode_for` allows them.
+        What's under a path that is deleted doesn't matter, whatever it is.
+        """
+    info = _saved(app, name, user, saveDir, generation)
+    mode = mode_for(info, mode)
+    plan = Plan("load", str(info.location))
+    place = "link" if mode in ("symlink", "hardlink") else "copy"
+    deleted: tuple[str, ...] = ()
+    for src, dst, entry in entries(info):
+        if str(dst).startswith(deleted):
+            state = None
+        else:
+            state = _in_place(src, dst, entry)
+        size = entry.get("size", 0)
+        if state is True:
+            plan.add("skip", str(dst), str(src), size)
+            continue
+        if state is False:
+            plan.add("delete", str(dst))
+            deleted += (str(dst) + os.sep,)
+        plan.manifest[str(dst)] = entry
+        if S_ISDIR(entry["mode"]):
+            plan.add("mkdir", str(dst), str(src))
+        else:
+            plan.add(place, str(dst), str(src), size)
+    return plan
+
+
+def load(app: str,
+         name: str = "default",
+         user: str = config.userName,
+         saveDir: Union[str, Path] = config.saveDir,
+         force: bool = False,
+         mode: Optional[str] = None,
+         dry_run: bool = False,
+         generation: Optional[int] = None) -> bool:
+    """ Load a saved config from `saveDir/userName-app-confName`.
+
+        Every conflict is checked before anything is touched, and asked about
+        once. Files that are already in place are left alone.
+        With `dry_run`, the plan is printed as JSON instead.
+        With `generation`, a previous generation of the config is loaded.
+        Without a `mode`, the lightest one `mode_for` allows is used.
+        Returns False if the config doesn't exist or loading was cancelled.
+        """
+    if not index.query(app, name, user):
+        tools.eprint(f"No {name} config saved for {app} by {user}.")
+        return False
+    try:
+        info = _saved(app, name, user, saveDir, generation)
+    except FileNotFoundError:
+        tools.eprint(f"No generation {generation} of {user}'s {name} " +
+                     f"config for {app}.")
+        return False
+    if mode is not None and mode_for(info, mode) != mode:
+        tools.eprint(f"{user}'s {name} config for {app} can't be linked " +
+                     "to, loading copies of it instead, see --mode.")
+    mode = mode_for(info, mode)
+    linker = Linker(mode)
+    todo = plan(app, name, user, saveDir, mode, generation)
+    if dry_run:
+        print(todo.to_json())
+        return True
+    conflicts = [a.path for a in todo if a.kind == "delete"]
+
+    if conflicts and not force:
+        print(f"Loading {user}'s {name} config for {app} would overwrite:")
+        for dst in conflicts:
+            print("  " + dst)
+        while True:
+            answer = 'x' + str(input("Overwrite them ? (y/N) ")).lower()
+            if answer in ['x', 'xn', 'xno']:
+                print(f"Skipping {user}'s {name} config for {app}.")
+                return False
+            elif answer in ['xy', 'xyes']:
+                break
+
+    for action in todo:
+        dst = Path(action.path)
+        if action.kind == "delete":
+            if dst.is_dir() and not dst.is_symlink():
+                shutil.rmtree(dst)
+            else:
+                dst.unlink()
+        elif action.kind == "mkdir":
+            dst.mkdir(parents=True, exist_ok=True)
+        elif action.kind in ("link", "copy"):
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            linker.place(Path(action.src), dst, todo.manifest[action.path])
+
+    done = ", ".join(f"{n} {m}" for m, n in sorted(linker.stats.items()))
+    print(f"Loaded {user}'s {name} config for {app}" +
+          (f" ({done})." if done else ", already in place."))
+    return True
@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" List the generations of a saved config. """
+
+from pathlib import Path
+from stat import S_ISDIR
+import time
+from typing import Union
+
+import DotManager.config as config
+from DotManager.commands.save import SaveInfo
+
+
+def _changes(new: dict[str, dict], old: dict[str, dict]) -> str:
+    """ How many files were added, removed and modified between manifests. """
+    files = {rel for rel, e in new.items() if not S_ISDIR(e.get("mode", 0))}
+    before = {rel for rel, e in old.items() if not S_ISDIR(e.get("mode", 0))}
+    modified = sum(1 for rel in files & before if new[rel] != old[rel])
+    return f"+{len(files - before)} -{len(before - files)} ~{modified}"
+
+
+def log(app: str,
+        name: str = "default",
+        user: str = config.userName,
+        saveDir: Union[str, Path] = config.saveDir) -> bool:
+    """ Print every generation of a config, newest first.
+
+        Each one comes with when it was saved, how many files it holds, and
+        how many were added, removed and modified since the one before.
+        Returns False if there's no such config.
+        """
+    history = SaveInfo(app, name, user, saveDir).history()
+    if not history:
+        return False
+    print(f"Generations of {user}'s {name} config for {app}:")
+    for i, (generation, dotmatch) in enumerate(history):
+        files: dict = dotmatch.get("files", {})
+        older: dict = history[i + 1][1].get("files", {}) \
+            if i + 1 < len(history) else {}
+        saved = time.strftime("%Y-%m-%d %H:%M:%S",
+                              time.localtime(dotmatch.get("time", 0))) \
+            if "time" in dotmatch else "?" * 19
+        count = sum(1 for e in files.values()
+                    if not S_ISDIR(e.get("mode", 0)))
+        print(f"  {generation:>4}  {saved}  {count:>6} files  " +
+              _changes(files, older) + ("  (current)" if i == 0 else ""))
+    return True
@@ -22,38 +22,127 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import contextlib
 from pathlib import Path
-import shutil
 from typing import Union
 
 from DotManager.commands.save import SaveInfo
 from DotManager.index import index
+from DotManager.plan import Plan
 import DotManager.config as config
+import DotManager.tools as tools
+import DotManager.trash as trash
 
 # XXX: Make this more interactive, maybe ?
 
 
+def _confirm(prompt: str, force: bool) -> bool:
+    while not force:
+        answer = 'x' + str(input(prompt)).lower()
+        if answer == 'xy':
+            return True
+        elif answer in ['x', 'xn']:
+            return False
+    return True
+
+
+def _trash(app: str, name: str, user: str, saveDir: Union[Path, str]):
+    """ Move a config's directory to the trash and drop it from the index.
+
+        The index is only changed once the config is in the trash, so that
+        a failed move leaves both as they were.
+        """
+    info = SaveInfo(app, name, user, saveDir)
+    trash.move(info.location, user, app, name, saveDir)
+    index.remove(app, name, user)
+    for generation in info.old_generations():
+        trash.move(info.generation_dir(generation), user, app, name, saveDir,
+                   generation)
+    with contextlib.suppress(OSError):
+        info.generations.rmdir()
+
+
+def plan(app: str,
+         name: str,
+         user: str = config.userName,
+         saveDir: Union[Path, str] = config.saveDir) -> Plan:
+    """ Work out what removing a config would do, without writing.
+
+        The size of the deletion is what the config takes on disk, so it has
+        to be walked. Actually removing it doesn't need that.
+        """
+    location = SaveInfo(app, name, user, saveDir).location
+    size = 0
+    for _, entry in tools.scantree(location):
+        if entry.is_file(follow_symlinks=False):
+            size += entry.stat(follow_symlinks=False).st_size
+    result = Plan("rm", str(location))
+    result.add("delete", str(location), size=size)
+    return result
+
+
 def rm(app: str,
        name: str,
        user: str = config.userName,
        saveDir: Union[Path, str] = config.saveDir,
-       force: bool = False):
-    """ Remove a config from the index and from `config.saveDir` """
+       force: bool = False,
+       dry_run: bool = False) -> bool:
+    """ Remove a config from the index and from `config.saveDir`
+
+        The config is moved to the trash, which is emptied in the background.
+        With `dry_run`, the plan is printed as JSON instead.
+        Returns False if there was nothing to remove, or it was cancelled.
+        """
     if not index.query(app, name, user):
-        return
-    path: Path = SaveInfo(app, name, user, saveDir).location
+        return False
+    if dry_run:
+        print(plan(app, name, user, saveDir).to_json())
+        return True
     prompt = f"Are you sure you want to remove " +\
              f"{user}'s config " +\
              f"{name} for " +\
              f"{app} ? (N/y) "
-    while not force:
-        answer = 'x' + str(input(prompt)).lower()
-        if answer == 'xy':
-            index.remove(app, name, user)
-            if path.exists():
-                shutil.rmtree(path)
-            break
-        elif answer in ['x', 'xn']:
-            break
-        else:
-            continue
+    if not _confirm(prompt, force):
+        return False
+    _trash(app, name, user, saveDir)
+    trash.reclaim_in_background(config.trashGrace, saveDir)
+    return True
+
+
+def rm_all(configs: list[tuple[str, str, str]],
+           saveDir: Union[Path, str] = config.saveDir,
+           force: bool = False,
+           dry_run: bool = False) -> int:
+    """ Remove several configs, given as (user, app, name), asking only once.
+
+        With `dry_run`, each config's plan is printed as a line of JSON
+        instead. Returns the number of configs removed.
+        """
+    configs = [c for c in configs if index.query(c[1], c[2], c[0])]
+    if not configs:
+        return 0
+    if dry_run:
+        for user, app, name in configs:
+            print(plan(app, name, user, saveDir).to_json())
+        return 0
+    prompt = f"Are you sure you want to remove {len(configs)} configs ? (N/y) "
+    if not _confirm(prompt, force):
+        return 0
+    for user, app, name in configs:
+        _trash(app, name, user, saveDir)
+    trash.reclaim_in_background(config.trashGrace, saveDir)
+    return len(configs)
+
+
+def undo(app: str,
+         name: str,
+         user: str = config.userName,
+         saveDir: Union[Path, str] = config.saveDir) -> bool:
+    """ Bring a removed config back from the trash, if it's still there. """
+    if index.query(app, name, user):
+        print(f"{app} config '{name}' already exists for {user}.")
+        return False
+    if trash.restore(user, app, name, saveDir) is None:
+        return False
+    index.insert(app, name, user)
+    return True
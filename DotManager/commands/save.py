@@ -6,17 +6,37 @@
 # Ludovic Fernandez
 # http://github.com/Wrexes
 
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures import as_completed
+import contextlib
+import errno
 import json
 import os
-from pathlib import Path
+from pathlib import Path, PurePath
 import re
 import shutil
-from typing import Union
+from stat import S_ISDIR
+import tempfile
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional, Union
 
 import DotManager.config as config
 from DotManager.dotinfo import DotInfo, installed
+from DotManager.copier import Copier
 from DotManager.index import index
+from DotManager.plan import Action, Plan
+from DotManager.store import Store
+import DotManager.timings as timings
+import DotManager.trash as trash
 from DotManager.tools import realpath
+import DotManager.tools as tools
+
+
+Walked = tuple[Path, str, os.stat_result]
+""" A path found while walking includes: (live path, path relative to the
+    saved config's location, stat).
+    """
 
 
 class SaveInfo:
@@ -24,7 +44,9 @@ class SaveInfo:
                  app: Union[DotInfo, str],
                  name: str,
                  user: str,
-                 saveDir: Union[str, Path]):
+                 saveDir: Union[str, Path],
+                 checksum: bool = False,
+                 store: Optional[Store] = None):
 
         def __get_name() -> str:
             return app.name if isinstance(app, DotInfo) else app
@@ -33,6 +55,7 @@ class SaveInfo:
         if isinstance(app, DotInfo):
             self.include = app.include
             self.exclude = app.exclude
+            self.matcher = app.matcher
 
         # SaveInfo stuff
         self.userName = user
@@ -43,80 +66,965 @@ class SaveInfo:
         # Save destination name and location
         self.baseName = Path(f"{user}-{__get_name()}-{name}")
         self.location = Path(saveDir).joinpath(self.baseName)
+        self.dotmatch = self.location.joinpath(".dotmatch.json")
+
+        # Previous generations, and the one being saved
+        self.generations = Path(saveDir).joinpath(".generations",
+                                                  self.baseName)
+        self.generation = 0
 
         # String builders for code readability
         self._FileExists = \
             f"{__get_name()} config '{name}' already exists for {user}."
         self._Skip = f"Skipping {user}'s {name} config for {__get_name()}."
+        self._Done = f"Saved {user}'s {name} config for {__get_name()}."
 
         # Dictionary matching what goes where
         self.match = {}
 
-    def create_dir(self):
+        # Manifest of saved files, keyed by path relative to self.location
+        # Also compare file hashes when sizes match but mtimes don't
+        # Hashes of live files, by path, can be shared between SaveInfos
+        self.checksum = checksum
+        self.hashes: dict[str, str] = {}
+        self.manifest: dict[str, dict] = {}
+        self._dirty: dict[str, Path] = {}
+        # Live files that may be links to saved ones, (st_dev, st_ino) by path
+        self._linked: dict[str, tuple[int, int]] = {}
+        self._executor: Optional[Executor] = None
+
+        # When set, saved files are hardlinks to blobs from the object store
+        self.store = store
+
+        # Copies go through the fastest strategy the filesystems support
+        self.copier = Copier()
+        self.updated = 0
+        self.removed = 0
+        self.bytes = 0
+        self.excluded = 0
+
+        # Pending copies, when they are handed to an executor
+        self._pending: list[Future] = []
+
+    def read_dotmatch(self) -> dict:
+        """ Read `.dotmatch.json` as is, or return an empty dict. """
+        try:
+            with self.dotmatch.open(mode='rt') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def load_dotmatch(self) -> dict[str, dict]:
+        """ Read the file manifest left in `.dotmatch.json` by the last save.
+
+            Returns an empty dict if there is no manifest, if it was written
+            by an older version that only stored the include matches, or if
+            the config wasn't saved with the same store setting.
+            """
+        dotmatch = self.read_dotmatch()
+        if dotmatch.get("store", False) != (self.store is not None):
+            return {}
+        files = dotmatch.get("files")
+        return files if isinstance(files, dict) else {}
+
+    def generation_dir(self, generation: int) -> Path:
+        """ Where a previous generation of the config is kept. """
+        return self.generations.joinpath(str(generation))
+
+    def old_generations(self) -> list[int]:
+        """ Numbers of the previous generations that are kept, oldest first. """
+        try:
+            names = os.listdir(self.generations)
+        except OSError:
+            return []
+        return sorted(int(n) for n in names if n.isdigit())
+
+    def history(self) -> list[tuple[int, dict]]:
+        """ Every generation of the config, as (number, `.dotmatch.json`),
+            newest first.
+
+            Configs saved before generations existed are generation 1.
+            """
+        found = [(n, self.generation_dir(n)) for n in self.old_generations()]
         if self.location.exists():
-            shutil.rmtree(self.location)
-        self.location.mkdir(parents=True)
+            current = self.read_dotmatch().get("generation")
+            found.append((current or (found[-1][0] + 1 if found else 1),
+                          self.location))
+        history = []
+        for n, location in reversed(found):
+            try:
+                with location.joinpath(self.dotmatch.name).open('rt') as f:
+                    history.append((n, json.load(f)))
+            except (OSError, json.JSONDecodeError):
+                history.append((n, {}))
+        return history
+
+    def use_generation(self, generation: int) -> bool:
+        """ Point this SaveInfo at a previous generation of the config.
+
+            Returns False if it isn't kept. The current generation can be
+            asked for too, in which case nothing changes.
+            """
+        if self.read_dotmatch().get("generation") == generation:
+            return True
+        location = self.generation_dir(generation)
+        if not location.is_dir():
+            return False
+        self.location = location
+        self.dotmatch = location.joinpath(self.dotmatch.name)
+        return True
+
+    def is_excluded(self, relpath: Union[str, PurePath],
+                    is_dir: bool = False) -> bool:
+        """ Check a path relative to `self.location` against the exclusions.
+
+            See `DotManager.ignore.Matcher` for how patterns match.
+            """
+        return self.matcher.excluded(str(relpath), is_dir)
+
+    def plan(self, walk: Optional[Iterable[Walked]] = None) -> Plan:
+        """ Work out what saving the includes would do, without writing.
+
+            Excluded directories are pruned while walking, so they are never
+            read. Files whose size, mtime and mode match the previous
+            manifest are skipped, and files that disappeared since the
+            previous save are deleted. A directory without a usable manifest
+            can't be updated in place, so it is wiped first.
+            The includes are walked with `walk()`, unless a `walk` is given,
+            see `walk_shared`.
+            """
+        plan = Plan("save", str(self.location))
+        plan.previous = self.load_dotmatch()
+        self._linked.clear()
+        if not plan.previous and self.location.exists():
+            plan.add("wipe", "")
+        for src, rel, st in self.walk() if walk is None else walk:
+            self._plan_path(plan, src, rel, st)
+        self._plan_stale(plan)
+        return plan
+
+    def plan_paths(self, rels: Iterable[str]) -> Plan:
+        """ Work out what saving only some paths again would do.
+
+            The config has to have been saved by this SaveInfo already.
+            `rels` are relative to `self.location`, like the manifest's keys.
+            Directories among them are walked again, paths that are gone are
+            deleted, and the rest of the manifest is kept as is. The parents
+            of the paths are planned too, as their mtimes changed.
+            """
+        plan = Plan("save", str(self.location))
+        plan.previous = self.manifest
+        self._linked.clear()
+        plan.manifest = dict(self.manifest)
+        rels = set(rels)
+        parents = {os.path.dirname(rel) for rel in rels} - {""}
+        # Paths found while walking a directory are done already
+        found: set[str] = set()
+        for rel in sorted(rels | parents):
+            if rel in found:
+                continue
+            root, _, rest = rel.partition(os.sep)
+            inc = self.match.get(root) or next(
+                (i for i in self.include if Path(realpath(i)).name == root),
+                None)
+            if inc is None:
+                continue
+            src = Path(realpath(inc)).joinpath(rest)
+            try:
+                st: Optional[os.stat_result] = src.stat()
+            except OSError:
+                st = None
+            if st is None or self.matcher.excluded(rel, S_ISDIR(st.st_mode)):
+                self._forget(plan, rel)
+                if rel == root:
+                    self.match.pop(root, None)
+                continue
+            self.match[root] = inc
+            if not S_ISDIR(st.st_mode):
+                self._forget(plan, rel, children_only=True)
+                self._plan_path(plan, src, rel, st)
+                continue
+            self._plan_path(plan, src, rel, st)
+            if rel not in rels:
+                continue
+            for sub, entry in tools.scantree(src, self._prune, rel):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found.add(sub)
+                self._plan_path(plan, Path(entry.path), sub, st)
+            self._forget(plan, rel, children_only=True, keep=found)
+        self._plan_stale(plan)
+        return plan
+
+    @staticmethod
+    def _forget(plan: Plan, rel: str, children_only: bool = False,
+                keep: Iterable[str] = ()):
+        """ Drop `rel` and what's under it from a plan's manifest.
+
+            They are then deleted by `_plan_stale`.
+            """
+        keep = set(keep)
+        prefix = rel + os.sep
+        for key in list(plan.manifest):
+            if key in keep:
+                continue
+            if key.startswith(prefix) or (key == rel and not children_only):
+                del plan.manifest[key]
+
+    def walk(self) -> Iterator[Walked]:
+        """ List the includes as they are now, leaving exclusions out.
 
-    def copy_conf(self):
+            Yields (live path, path relative to `self.location`, stat),
+            directories before their content. Excluded directories are
+            pruned, and what goes where is recorded in `self.match`.
+            """
         for inc in self.include:
             src = Path(realpath(inc))
-            dst = self.location.joinpath(src.name)
-            if not src.exists() or dst.exists():
+            if src.name in self.match:
+                continue
+            try:
+                st = src.stat()
+            except OSError:
+                continue
+            if self.matcher.match(src.name, S_ISDIR(st.st_mode)):
+                self.excluded += 1
                 continue
-            if src.is_file():
-                shutil.copy2(src, dst)
-            else:
-                shutil.copytree(src, dst)
             self.match[src.name] = inc
+            yield src, src.name, st
+            if not S_ISDIR(st.st_mode):
+                continue
+            for rel, entry in tools.scantree(src, self._prune, src.name):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                yield Path(entry.path), rel, st
 
-    def cleanup_exclusions(self):
-        for exc in self.exclude:
-            for item in sorted(self.location.rglob(exc)):
-                if item.is_file():
-                    os.remove(item)
+    def _prune(self, relpath: str, entry: os.DirEntry) -> bool:
+        """ Tell `tools.scantree` to skip excluded files and directories. """
+        if self.matcher.match(relpath, entry.is_dir()):
+            self.excluded += 1
+            return True
+        return False
+
+    def _plan_path(self, plan: Plan, src: Path, rel: str,
+                   st: os.stat_result):
+        """ Plan a single file or directory, unless it's up to date. """
+        old: dict = plan.previous.get(rel, {})
+        if S_ISDIR(st.st_mode):
+            entry = {"mtime": st.st_mtime_ns, "mode": st.st_mode}
+            plan.manifest[rel] = entry
+            plan.add("skip" if old == entry else "mkdir", rel, str(src))
+            return
+        entry = {"size": st.st_size, "mtime": st.st_mtime_ns, "mode": st.st_mode}
+        plan.manifest[rel] = entry
+        # Hardlinked, or reached through a symlink to the saved config
+        if st.st_nlink > 1 or str(src).startswith(str(self.location) + os.sep):
+            self._linked[rel] = (st.st_dev, st.st_ino)
+        if all(old.get(k) == v for k, v in entry.items()):
+            if "hash" in old:
+                entry["hash"] = old["hash"]
+            plan.add("skip", rel, str(src), st.st_size)
+            return
+        if self.checksum or self.store is not None:
+            entry["hash"] = self._hash(src)
+        if (self.checksum
+                and old.get("hash") == entry["hash"]
+                and old.get("mode") == entry["mode"]):
+            # Blobs are shared, their metadata lives in the manifest only.
+            if self.store is None:
+                plan.add("touch", rel, str(src))
+            else:
+                plan.add("skip", rel, str(src), st.st_size)
+            return
+        if "hash" in old:
+            plan.released.append(old["hash"])
+        plan.add("copy" if self.store is None else "link", rel, str(src),
+                 st.st_size)
+
+    def _hash(self, src: Path) -> str:
+        """ Hash a live file, once even if several configs include it. """
+        digest = self.hashes.get(str(src))
+        if digest is None:
+            digest = self.hashes[str(src)] = tools.filehash(src)
+        return digest
+
+    @staticmethod
+    def _plan_stale(plan: Plan):
+        """ Delete whatever was saved previously but wasn't found this time. """
+        # Children sort after their parents, reversing deletes them first.
+        for rel in sorted(plan.previous.keys() - plan.manifest.keys(),
+                          reverse=True):
+            old = plan.previous[rel]
+            plan.add("delete", rel, size=old.get("size", 0))
+            if "hash" in old:
+                plan.released.append(old["hash"])
+
+    def apply(self, plan: Plan, executor: Optional[Executor] = None):
+        """ Carry out a plan made by `plan()` or `plan_paths()`.
+
+            If an `executor` is given, the copies are handed to it.
+            """
+        self._executor = executor
+        self.updated = self.removed = self.bytes = 0
+        self.copier.stats.clear()
+        self.location.mkdir(parents=True, exist_ok=True)
+        for action in plan:
+            dst = self.location.joinpath(action.path)
+            old: dict = plan.previous.get(action.path, {})
+            if action.kind == "wipe":
+                shutil.rmtree(self.location)
+                self.location.mkdir()
+            elif action.kind == "mkdir":
+                if old and not S_ISDIR(old["mode"]):
+                    dst.unlink(missing_ok=True)
+                dst.mkdir(exist_ok=True)
+                self._dirty[action.path] = Path(action.src)
+            elif action.kind in ("copy", "link"):
+                self.updated += 1
+                self.bytes += action.size
+                args = (Path(action.src), dst, old,
+                        plan.manifest[action.path])
+                if self._executor is None:
+                    self._copy(*args)
                 else:
-                    shutil.rmtree(item)
-        # for root, dirs, files in os.walk(destination):
-        #     if dot.is_excluded(root):
-        #         shutil.rmtree(root)
-        #     for f in files:
-        #         if dot.is_excluded(f):
-        #             os.remove(f)
-        """ I'm keeping this in case the above exclusion cleanup code breaks.
-            I have a bad feeling about it for some reason. It seemed too simple.
+                    self._pending.append(
+                        self._executor.submit(self._copy, *args))
+            elif action.kind == "touch":
+                shutil.copystat(action.src, dst)
+        for future in self._pending:
+            future.result()
+        self._pending.clear()
+        for action in plan:
+            if action.kind == "delete":
+                self._delete(action.path, plan.previous[action.path])
+        self._sync_dirs()
+        if self.store is not None:
+            self.store.release(plan.released)
+        self.manifest = plan.manifest
+
+    def apply_staged(self, plan: Plan, executor: Optional[Executor] = None,
+                     resume: bool = False):
+        """ Carry out a plan made by `plan()` in a staging directory, then
+            swap it with `self.location`.
+
+            Until the swap, which is atomic where the kernel supports it, the
+            previous save is left untouched. Unchanged files are hardlinked
+            from it rather than copied. Every file that is done is written to
+            a journal, so that with `resume`, an interrupted save goes on
+            from where it stopped instead of starting over.
+            Once swapped, the previous save becomes a previous generation,
+            sharing the unchanged files with the new one. The journal is only
+            removed then, a previous save that couldn't be retired is retired
+            by the next save, see `_recover`.
+            The manifest is written too.
+            A plan that only skips leaves the previous save in place, as the
+            current generation: nothing is staged, swapped nor retired.
             """
+        stage = self.staging
+        journal = self.journal
+        self._recover()
+        if self._unchanged(plan):
+            shutil.rmtree(stage, ignore_errors=True)
+            journal.unlink(missing_ok=True)
+            return
+        done = self._read_journal(journal) if resume and stage.is_dir() else {}
+        if not done:
+            shutil.rmtree(stage, ignore_errors=True)
+            journal.unlink(missing_ok=True)
+        stage.mkdir(parents=True, exist_ok=True)
+        self._executor = executor
+        self.updated = self.removed = self.bytes = 0
+        self.copier.stats.clear()
+        lock = threading.Lock()
 
-    def create_dotmatch(self):
-        with self.location.joinpath(".dotmatch.json").open(mode='wt') as f:
-            json.dump(self.match, f, indent=4, sort_keys=True)
+        with open(journal, 'at', buffering=1) as log:
+            def record(rel: str, entry: dict):
+                with lock:
+                    log.write(json.dumps([rel, entry]) + "\n")
+
+            for action in plan:
+                rel = action.path
+                entry = plan.manifest.get(rel)
+                if entry is None:
+                    continue
+                dst = stage.joinpath(rel)
+                if S_ISDIR(entry["mode"]):
+                    if not dst.is_dir() or dst.is_symlink():
+                        self._clear(dst)
+                        dst.mkdir()
+                    self._dirty[rel] = Path(action.src)
+                    continue
+                if done.get(rel) == entry:
+                    continue
+                # Whatever an interrupted save left there may be incomplete
+                if done:
+                    self._clear(dst)
+                if action.kind not in ("copy", "link"):
+                    self._carry(rel, dst, action)
+                    record(rel, entry)
+                    continue
+                self.updated += 1
+                self.bytes += action.size
+                args = (Path(action.src), dst, rel, entry, record)
+                if self._executor is None:
+                    self._stage(*args)
+                else:
+                    self._pending.append(
+                        self._executor.submit(self._stage, *args))
+            for future in self._pending:
+                future.result()
+            self._pending.clear()
+
+        if config.generations > 0:
+            for rel, live in self._linked.items():
+                self._detach(rel, live)
+        if done:
+            self._prune_staging(plan.manifest)
+        self._sync_dirs(stage)
+        self.manifest = plan.manifest
+        # Configs saved before generations existed get a number after the
+        # kept ones, as `history` does
+        retiring = 0
+        if self.location.exists():
+            retiring = self._free_generation(
+                self.read_dotmatch().get("generation", 0))
+        self.generation = max([retiring] + self.old_generations()) + 1
+        with timings.phase("create_dotmatch", self.dotName):
+            self.create_dotmatch(stage)
+        self._swap(retiring)
+        journal.unlink()
+        self.removed = sum(1 for a in plan if a.kind == "delete"
+                           and not S_ISDIR(plan.previous[a.path]["mode"]))
+        if self.store is not None:
+            self.store.release(plan.released)
+
+    def _unchanged(self, plan: Plan) -> bool:
+        """ Whether a plan would save the same config again.
+
+            If so, the manifest is updated in place when only metadata that
+            isn't saved with the files changed, like mtimes in the store.
+            """
+        if (any(action.kind != "skip" for action in plan)
+                or not self.location.is_dir()):
+            return False
+        dotmatch = self.read_dotmatch()
+        if dotmatch.get("store", False) != (self.store is not None):
+            return False
+        self.updated = self.removed = self.bytes = 0
+        self.copier.stats.clear()
+        self.manifest = plan.manifest
+        self.generation = dotmatch.get("generation", 0)
+        if plan.manifest != plan.previous or dotmatch.get("match") != self.match:
+            self.create_dotmatch()
+        return True
+
+    @property
+    def staging(self) -> Path:
+        """ Where a save is put together, before it replaces the previous. """
+        return Path(self.saveDir).joinpath(".staging", self.baseName)
+
+    @property
+    def journal(self) -> Path:
+        """ Files done staging, kept next to the staging directory so that
+            it outlives the swap.
+            """
+        return self.staging.with_name(self.baseName.name + ".journal")
+
+    def _recover(self):
+        """ Put back whatever a save that failed while swapping left behind.
+
+            With renames, the previous save may have been moved aside before
+            the new one took its place. Once swapped, the previous save may
+            still be in staging if it couldn't be retired, it's retired now.
+            """
+        stage = self.staging
+        old = stage.with_name(stage.name + ".old")
+        if old.is_dir() and not self.location.exists():
+            os.rename(old, self.location)
+        current = self.read_dotmatch().get("generation", 0)
+        for path in (stage, old):
+            try:
+                with path.joinpath(self.dotmatch.name).open('rt') as f:
+                    generation = json.load(f).get("generation", 0)
+            except (OSError, ValueError, AttributeError):
+                continue
+            # A newer one was staged, but not swapped yet
+            if generation >= current:
+                continue
+            self._retire(path, generation)
+            self.journal.unlink(missing_ok=True)
+
+    @staticmethod
+    def _read_journal(journal: Path) -> dict[str, dict]:
+        """ Files an interrupted save was done with, and their entries. """
+        done: dict[str, dict] = {}
+        try:
+            with open(journal, 'rt') as f:
+                for line in f:
+                    try:
+                        rel, entry = json.loads(line)
+                    except ValueError:
+                        # Only the last line can be cut short
+                        break
+                    done[rel] = entry
+        except OSError:
+            pass
+        return done
+
+    @staticmethod
+    def _clear(dst: Path):
+        """ Remove whatever is at `dst`, if anything. """
+        if dst.is_dir() and not dst.is_symlink():
+            shutil.rmtree(dst)
+        else:
+            dst.unlink(missing_ok=True)
+
+    def _stage(self, src: Path, dst: Path, rel: str, entry: dict,
+               record: Callable[[str, dict], None]):
+        """ Copy a file to the staging directory, and journal it. """
+        self._copy(src, dst, {}, entry)
+        record(rel, entry)
+
+    def _carry(self, rel: str, dst: Path, action: Action):
+        """ Carry a file that didn't change over from the previous save. """
+        old = self.location.joinpath(rel)
+        if action.kind == "touch":
+            # Metadata is per inode, it would change in older generations too
+            self.copier.copy(old, dst)
+            shutil.copystat(action.src, dst)
+            return
+        try:
+            os.link(old, dst)
+        except OSError as e:
+            # Too many links already
+            if e.errno not in (errno.EMLINK, errno.EPERM):
+                raise
+            shutil.copy2(old, dst)
+
+    def _detach(self, rel: str, live: tuple[int, int]):
+        """ Give the previous save its own copy of a file that is linked to
+            from a live file, before it becomes a previous generation.
+
+            Configs loaded as links before generations were kept, or by hand,
+            would otherwise change previous generations when edited.
+            """
+        old = self.location.joinpath(rel)
+        try:
+            st = os.lstat(old)
+        except OSError:
+            return
+        if (st.st_dev, st.st_ino) != live:
+            return
+        fd, tmp = tempfile.mkstemp(dir=old.parent, prefix=".tmp-")
+        os.close(fd)
+        try:
+            self.copier.copy(old, tmp)
+            os.replace(tmp, old)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _prune_staging(self, manifest: dict[str, dict]):
+        """ Remove what an interrupted save staged, but isn't wanted now. """
+        found: list[os.DirEntry] = []
+
+        def prune(relpath: str, entry: os.DirEntry) -> bool:
+            if relpath in manifest:
+                return False
+            found.append(entry)
+            return True
+
+        for _ in tools.scantree(self.staging, prune):
+            pass
+        for entry in found:
+            self._clear(Path(entry.path))
+
+    def _swap(self, previous: int):
+        """ Put the staging directory in place of the previous generation.
+
+            The previous generation is kept, or moved to the trash, see
+            `config.generations`.
+            """
+        stage = self.staging
+        if not self.location.exists():
+            os.rename(stage, self.location)
+            return
+        try:
+            tools.exchange(stage, self.location)
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+            # Not atomic, but the new save is complete by now
+            old = stage.with_name(stage.name + ".old")
+            os.rename(self.location, old)
+            os.rename(stage, self.location)
+            stage = old
+        self._retire(stage, previous)
+
+    def _free_generation(self, generation: int) -> int:
+        """ `generation`, or a number after the kept ones if it's taken. """
+        if generation < 1 or self.generation_dir(generation).exists():
+            return max(self.old_generations(), default=0) + 1
+        return generation
+
+    def _retire(self, old: Path, generation: int):
+        """ Keep a previous generation, and drop those that are too old. """
+        keep = config.generations
+        generation = self._free_generation(generation)
+        if keep > 0:
+            self.generations.mkdir(parents=True, exist_ok=True)
+            os.rename(old, self.generation_dir(generation))
+        else:
+            trash.move(old, self.userName, self.dotName, self.confName,
+                       self.saveDir, generation)
+        for n in self.old_generations()[:-keep or None]:
+            trash.move(self.generation_dir(n), self.userName, self.dotName,
+                       self.confName, self.saveDir, n)
+
+    def copy_conf(self, executor: Optional[Executor] = None):
+        """ Copy the includes to `self.location`, leaving exclusions out.
+
+            Only what changed since the previous save is copied, see `plan`.
+            The walk happens in the calling thread, but if an `executor` is
+            given, the copies themselves are handed to it.
+            """
+        self.apply(self.plan(), executor)
+
+    def resave(self, rels: Iterable[str]):
+        """ Save only some paths again, see `plan_paths`.
+
+            The manifest still has to be written with `create_dotmatch`.
+            """
+        self.apply(self.plan_paths(rels))
+
+    def _copy(self, src: Path, dst: Path, old: dict, entry: dict):
+        """ Replace whatever was saved at `dst` with `src`.
+
+            The old file is never written through nor removed first: it may
+            be read-only, linked elsewhere, or `src` itself for a config
+            loaded as symlinks. The copy is made next to it and renamed over.
+            """
+        if old and S_ISDIR(old["mode"]):
+            shutil.rmtree(dst, ignore_errors=True)
+            old = {}
+        target = dst
+        if old:
+            fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix=".tmp-")
+            os.close(fd)
+            os.unlink(tmp)
+            target = Path(tmp)
+        try:
+            if self.store is not None:
+                digest = self.store.add(src, entry["hash"], self.copier)
+                self.store.link(digest, target)
+            else:
+                self.copier.copy(src, target)
+            if old:
+                os.replace(target, dst)
+        except BaseException:
+            if old:
+                target.unlink(missing_ok=True)
+            raise
+
+    def _delete(self, rel: str, old: dict):
+        """ Remove something that was saved previously. """
+        dst = self.location.joinpath(rel)
+        if S_ISDIR(old["mode"]):
+            shutil.rmtree(dst, ignore_errors=True)
+            return
+        # Its parent may have been replaced by a file already
+        with contextlib.suppress(FileNotFoundError, NotADirectoryError):
+            dst.unlink()
+        self.removed += 1
+
+    def _sync_dirs(self, root: Optional[Path] = None):
+        """ Copy permissions and times to the directories that changed.
+
+            Done last and deepest first, since adding files to a directory
+            updates its mtime.
+            """
+        root = root or self.location
+        for rel in sorted(self._dirty, reverse=True):
+            shutil.copystat(self._dirty[rel], root.joinpath(rel))
+        self._dirty.clear()
+
+    def cleanup_exclusions(self):
+        """ Remove exclusions that made it to `self.location` anyway.
+
+            Saves already leave them out while walking, so this is only
+            useful on directories that were filled some other way.
+            """
+        found: list[os.DirEntry] = []
+
+        def prune(relpath: str, entry: os.DirEntry) -> bool:
+            if self.matcher.match(relpath, entry.is_dir()):
+                found.append(entry)
+                return True
+            return False
+
+        for _ in tools.scantree(self.location, prune):
+            pass
+        for entry in found:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+
+    def summary(self) -> str:
+        """ What was done, and how files were copied. """
+        if not self.updated and not self.removed:
+            return self._Done[:-1] + ", up to date."
+        done = f"{self.updated} updated, {self.removed} removed"
+        copied = self.copier.summary()
+        return self._Done[:-1] + f" ({done}" + \
+            (f", {copied})." if copied else ").")
+
+    def create_dotmatch(self, root: Optional[Path] = None):
+        """ Write what goes where, along with the manifest of saved files.
+
+            Only `apply_staged` numbers generations. Saving in place, like
+            `resave` does, keeps the number the config had, if any.
+            """
+        dotmatch = {"match": self.match,
+                    "files": self.manifest,
+                    "store": self.store is not None,
+                    "time": time.time()}
+        generation = self.generation or self.read_dotmatch().get("generation")
+        if generation:
+            dotmatch["generation"] = generation
+        path = self.dotmatch if root is None else \
+            root.joinpath(self.dotmatch.name)
+        with path.open(mode='wt') as f:
+            json.dump(dotmatch, f, indent=4, sort_keys=True)
+
+
+def overwrite(info: SaveInfo, force: bool = False) -> bool:
+    """ Ask whether an existing config should be overwritten.
+
+        Returns True right away if there's nothing to overwrite, or if
+        `force` is set.
+        """
+    if not index.query(info.dotName, info.confName, info.userName):
+        return True
+    while not force:
+        print(info._FileExists)
+        answer = 'x' + str(input("Overwrite it ? (y/N) ")).lower()
+        if answer in ['x', 'xn', 'xno']:
+            print(info._Skip)
+            return False
+        elif answer in ['xy', 'xyes']:
+            break
+        else:
+            continue
+    return True
+
+
+def walk_shared(infos: list[SaveInfo]) -> dict[SaveInfo, list[Walked]]:
+    """ Walk the includes of several configs, each path only once.
+
+        Apps often include the same paths, like vim and neovim both including
+        `~/.vim`. Every include is walked once, and what is found is handed
+        to each config that includes it, unless its own exclusions leave it
+        out. Directories are only pruned when every config excludes them.
+        The results can be given to `SaveInfo.plan`.
+        """
+    walks: dict[SaveInfo, list[Walked]] = {info: [] for info in infos}
+    groups: dict[Path, list[tuple[SaveInfo, str]]] = {}
+    for info in infos:
+        for inc in info.include:
+            groups.setdefault(Path(realpath(inc)), []).append((info, inc))
+
+    for src, group in groups.items():
+        try:
+            st = src.stat()
+        except OSError:
+            continue
+        isDir = S_ISDIR(st.st_mode)
+        sharing: list[SaveInfo] = []
+        for info, inc in group:
+            if src.name in info.match:
+                continue
+            if info.matcher.match(src.name, isDir):
+                info.excluded += 1
+                continue
+            info.match[src.name] = inc
+            sharing.append(info)
+            walks[info].append((src, src.name, st))
+        if not sharing or not isDir:
+            continue
+
+        # Configs each entry is kept for, and directories each one excludes
+        keptFor: dict[str, list[SaveInfo]] = {}
+        excluded: dict[SaveInfo, set[str]] = {info: set() for info in sharing}
+
+        def prune(rel: str, entry: os.DirEntry) -> bool:
+            isDir = entry.is_dir()
+            parent = os.path.dirname(rel)
+            kept = []
+            for info in sharing:
+                if parent in excluded[info]:
+                    if isDir:
+                        excluded[info].add(rel)
+                elif info.matcher.match(rel, isDir):
+                    info.excluded += 1
+                    if isDir:
+                        excluded[info].add(rel)
+                else:
+                    kept.append(info)
+            keptFor[rel] = kept
+            return not kept
+
+        for rel, entry in tools.scantree(src, prune, src.name):
+            kept = keptFor.pop(rel)
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            for info in kept:
+                walks[info].append((Path(entry.path), rel, st))
+    return walks
+
+
+def _save(info: SaveInfo, executor: Optional[Executor] = None,
+          walk: Optional[list[Walked]] = None, resume: bool = False):
+    """ Do the actual saving, once it's been agreed upon.
+
+        The index is written right away, so it agrees with what's on disk
+        even if something goes wrong later on.
+        """
+    app = info.dotName
+    with timings.phase("plan", app):
+        plan = info.plan(walk)
+    try:
+        with timings.phase("copy_conf", app) as p:
+            info.apply_staged(plan, executor, resume)
+            p.count(files=info.updated, bytes=info.bytes,
+                    excluded=info.excluded)
+    finally:
+        # Retiring the previous save can fail once the new one is in place
+        if info.location.exists():
+            index.insert(info.dotName, info.confName, info.userName)
+            index.update()
 
 
 def save(app: DotInfo,
          name: str = "default",
          user: str = config.userName,
          saveDir: Union[str, Path] = config.saveDir,
-         force: bool = False):
+         force: bool = False,
+         checksum: bool = False,
+         store: bool = config.useStore,
+         jobs: int = 1,
+         dry_run: bool = False,
+         resume: bool = False):
     """ Save your config to `saveDir/userName-dot.name-confName`.
         Also create a corresponding entry in the index.
+
+        Saving over an existing config only copies what changed since.
+        With `store`, file contents are deduplicated in the object store.
+        With more than one job, files are copied by a pool of threads.
+        With `dry_run`, the plan is printed as JSON instead.
+        With `resume`, a save that was interrupted goes on where it stopped.
         """
-    info = SaveInfo(app, name, user, saveDir)
-    if index.query(app.name, name, user):
-        while not force:
-            print(info._FileExists)
-            answer = 'x' + str(input("Overwrite it ? (y/N) ")).lower()
-            if answer in ['x', 'xn', 'xno']:
-                print(info._Skip)
-                return
-            elif answer in ['xy', 'xyes']:
-                break
-            else:
-                continue
-        shutil.rmtree(info.location)
-    info.create_dir()
-    info.copy_conf()
-    info.cleanup_exclusions()
-    info.create_dotmatch()
-    index.insert(app.name, name, user)
+    info = SaveInfo(app, name, user, saveDir, checksum,
+                    Store(saveDir) if store else None)
+    if dry_run:
+        print(info.plan().to_json())
+        return
+    if not overwrite(info, force):
+        return
+    if jobs < 2:
+        _save(info, resume=resume)
+    else:
+        with ThreadPoolExecutor(jobs) as executor:
+            _save(info, executor, resume=resume)
+    print(info.summary())
+
+
+def save_all(apps: Iterable[DotInfo],
+             name: str = "default",
+             user: str = config.userName,
+             saveDir: Union[str, Path] = config.saveDir,
+             force: bool = False,
+             checksum: bool = False,
+             store: bool = config.useStore,
+             jobs: int = 1,
+             dry_run: bool = False,
+             resume: bool = False) -> bool:
+    """ Save several apps' configs at once, `jobs` of them at a time.
+
+        Overwrite prompts are all asked upfront, since they can't be answered
+        from worker threads. Apps and file copies get separate pools, so that
+        apps waiting on their copies never starve the copies of workers.
+        Progress is printed from the calling thread only, one line per app.
+
+        Includes that several apps share are only walked once, and their
+        files only hashed once, see `walk_shared`.
+
+        With `dry_run`, each app's plan is printed as a line of JSON instead.
+        With `resume`, saves that were interrupted go on where they stopped.
+        Returns False if any of the apps failed to be saved.
+        """
+    infos: list[SaveInfo] = []
+    for app in apps:
+        info = SaveInfo(app, name, user, saveDir, checksum,
+                        Store(saveDir) if store else None)
+        if dry_run:
+            infos.append(info)
+            continue
+        print("Found supported app: " + app.name)
+        if overwrite(info, force):
+            infos.append(info)
+    hashes: dict[str, str] = {}
+    for info in infos:
+        info.hashes = hashes
+    with timings.phase("walk"):
+        walks = walk_shared(infos)
+
+    if dry_run:
+        for info in infos:
+            print(info.plan(walks.pop(info)).to_json())
+        return True
+    def report(info: SaveInfo, error: Optional[OSError]) -> bool:
+        """ Print how saving an app went, return whether it went fine. """
+        if error is not None:
+            tools.eprint(f"Failed to save {info.dotName}: {error}")
+            return False
+        print(info.summary())
+        return True
+
+    ok = True
+    if jobs < 2:
+        for info in infos:
+            error = None
+            try:
+                _save(info, walk=walks.pop(info), resume=resume)
+            except OSError as e:
+                error = e
+            ok = report(info, error) and ok
+        return ok
+
+    with ThreadPoolExecutor(jobs) as files, ThreadPoolExecutor(jobs) as pool:
+        futures = {pool.submit(_save, info, files, walks.pop(info), resume):
+                   info for info in infos}
+        for future in as_completed(futures):
+            error = None
+            try:
+                future.result()
+            except OSError as e:
+                error = e
+            ok = report(futures[future], error) and ok
+    return ok
+
+    with ThreadPoolExecutor(jobs) as files, ThreadPoolExecutor(jobs) as pool:
+        futures = {pool.submit(_save, info, files, walks.pop(info), resume):
+                   info for info in infos}
+        for future in as_completed(futures):
+            ok = report(futures[future], future) and ok
+    return ok
 
 
 # 1. Fetch set of installed apps
@@ -23,18 +23,18 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from pprint import pprint
-
 import DotManager.dotinfo as dotinfo
 from DotManager.index import index
 
 class show:
     @staticmethod
     def supported():
+        from pprint import pprint
         pprint(dotinfo.supported().keys())
 
     @staticmethod
     def installed():
+        from pprint import pprint
         pprint(dotinfo.installed().keys())
 
     @staticmethod
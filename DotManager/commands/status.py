@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Compare live configs with saved ones. """
+
+import difflib
+from pathlib import Path
+from stat import S_ISDIR
+import sys
+from typing import Iterable, Optional, Union
+
+import DotManager.config as config
+from DotManager.commands.save import SaveInfo
+from DotManager.dotinfo import DotInfo
+from DotManager.hashcache import HashCache
+import DotManager.tools as tools
+
+
+def _saved(info: SaveInfo) -> dict[str, dict]:
+    """ Manifest of a saved config, keyed by path relative to its location.
+
+        Configs saved by older versions don't have one, so it's made up from
+        the saved files themselves, which kept the live ones' metadata.
+        """
+    dotmatch = info.read_dotmatch()
+    files = dotmatch.get("files")
+    if isinstance(files, dict):
+        return files
+    files = {}
+    for root in dotmatch:
+        src = info.location.joinpath(root)
+        try:
+            st = src.stat()
+        except OSError:
+            continue
+        files[root] = {"size": st.st_size, "mtime": st.st_mtime_ns,
+                       "mode": st.st_mode}
+        for rel, entry in tools.scantree(src, prefix=root):
+            st = entry.stat()
+            files[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns,
+                          "mode": st.st_mode}
+    return files
+
+
+def _text(data: bytes) -> Optional[list[str]]:
+    """ Lines of a file's content, or None if it doesn't look like text. """
+    if b"\0" in data:
+        return None
+    try:
+        return data.decode().splitlines(keepends=True)
+    except UnicodeDecodeError:
+        return None
+
+
+def _diff(saved: Path, live: Path, rel: str):
+    """ Print a unified diff of a saved file against the live one. """
+    try:
+        old, new = _text(saved.read_bytes()), _text(live.read_bytes())
+    except OSError as e:
+        tools.eprint(f"Can't diff {rel}: {e}")
+        return
+    if old is None or new is None:
+        print(f"Binary files a/{rel} and b/{rel} differ")
+        return
+    for line in difflib.unified_diff(old, new, "a/" + rel, "b/" + rel):
+        sys.stdout.write(line if line.endswith("\n") else
+                         line + "\n\\ No newline at end of file\n")
+
+
+def status(app: DotInfo,
+           name: str = "default",
+           user: str = config.userName,
+           saveDir: Union[str, Path] = config.saveDir,
+           diff: bool = False,
+           jobs: Optional[int] = None,
+           cache: Optional[HashCache] = None) -> bool:
+    """ Print what changed in an app's live config since it was saved.
+
+        Files whose size and mtime match the saved ones are taken as is, the
+        others are hashed, by `jobs` processes, to tell whether their content
+        actually changed. With `diff`, modified text files are also shown as
+        unified diffs.
+
+        Returns True if the live config matches the saved one.
+        """
+    info = SaveInfo(app, name, user, saveDir)
+    saved = _saved(info)
+    live = {rel: (src, st) for src, rel, st in info.walk()}
+
+    changes: dict[str, str] = {}
+    check: list[str] = []
+    for rel, (src, st) in live.items():
+        if S_ISDIR(st.st_mode):
+            continue
+        entry = saved.get(rel)
+        if entry is None or S_ISDIR(entry["mode"]):
+            changes[rel] = "added"
+        elif (entry.get("size") != st.st_size
+              or entry.get("mode") != st.st_mode):
+            changes[rel] = "modified"
+        elif entry.get("mtime") != st.st_mtime_ns:
+            check.append(rel)
+    for rel, entry in saved.items():
+        if S_ISDIR(entry["mode"]):
+            continue
+        if rel not in live or S_ISDIR(live[rel][1].st_mode):
+            changes[rel] = "removed"
+
+    if check:
+        owned = cache is None
+        cache = cache or HashCache()
+        paths = [live[rel][0] for rel in check]
+        paths += [info.location.joinpath(rel) for rel in check
+                  if "hash" not in saved[rel]]
+        digests = cache.hash(paths, jobs)
+        if owned:
+            cache.write()
+        for rel in check:
+            old = saved[rel].get("hash") or \
+                digests.get(info.location.joinpath(rel))
+            if old is None or digests.get(live[rel][0]) != old:
+                changes[rel] = "modified"
+
+    if not changes:
+        print(f"{user}'s {name} config for {info.dotName} is up to date.")
+        return True
+    print(f"{user}'s {name} config for {info.dotName} changed:")
+    for rel in sorted(changes):
+        print(f"  {changes[rel] + ':':<9} {rel}")
+    if diff:
+        for rel in sorted(changes):
+            if changes[rel] == "modified":
+                _diff(info.location.joinpath(rel), live[rel][0], rel)
+    return False
+
+
+def status_all(apps: Iterable[DotInfo],
+               name: str = "default",
+               user: str = config.userName,
+               saveDir: Union[str, Path] = config.saveDir,
+               diff: bool = False,
+               jobs: Optional[int] = None) -> bool:
+    """ `status` for several apps, sharing one hash cache.
+
+        Returns True if every live config matches the saved one.
+        """
+    cache = HashCache()
+    ok = True
+    try:
+        for app in apps:
+            ok = status(app, name, user, saveDir, diff, jobs, cache) and ok
+    finally:
+        cache.write()
+    return ok
@@ -0,0 +1,240 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Keep saved configs up to date as their live files change. """
+
+import errno
+import os
+from pathlib import Path
+import time
+from typing import Iterable, NamedTuple, Optional, Union
+
+import DotManager.config as config
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.dotinfo import DotInfo
+from DotManager.index import index
+from DotManager.inotify import Event, Inotify
+from DotManager.inotify import IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE
+from DotManager.inotify import IN_DELETE, IN_DELETE_SELF, IN_EXCL_UNLINK
+from DotManager.inotify import IN_IGNORED, IN_ISDIR, IN_MODIFY
+from DotManager.inotify import IN_MOVE_SELF, IN_MOVED_FROM, IN_MOVED_TO
+from DotManager.inotify import IN_ONLYDIR, IN_Q_OVERFLOW
+from DotManager.store import Store
+from DotManager.tools import realpath
+import DotManager.tools as tools
+
+MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_DELETE
+        | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+        | IN_ONLYDIR | IN_EXCL_UNLINK)
+""" Events that may mean a saved config is out of date. """
+
+
+class _Target(NamedTuple):
+    """ What a watched directory is, for one of the configs it's part of.
+
+        `rel` is the directory's path relative to the config's location.
+        For the parent of an include, only events about the include itself
+        matter: `rel` is empty and `name` is the include's name.
+        """
+    info: SaveInfo
+    rel: str
+    path: Path
+    name: str = ""
+
+
+class Watcher:
+    """ Saves configs again whenever their live files change.
+
+        Every directory of the includes is watched with inotify, except for
+        excluded ones, along with the directories holding the includes.
+        Changed paths are collected until no event came for `delay` seconds,
+        or for at most `maxDelay` seconds, and only these are saved again.
+        """
+
+    def __init__(self, infos: Iterable[SaveInfo],
+                 delay: float = 1.0, maxDelay: float = 10.0):
+        self.infos: list[SaveInfo] = list(infos)
+        self.delay = delay
+        self.maxDelay = maxDelay
+        self.inotify = Inotify()
+        self._watches: dict[int, list[_Target]] = {}
+        self._dirty: dict[SaveInfo, set[str]] = {}
+        self._rescan = False
+        self._warned = False
+
+    def watch_all(self):
+        """ Watch everything the configs are made of. """
+        for info in self.infos:
+            for inc in info.include:
+                src = Path(realpath(inc))
+                self._add(_Target(info, "", src.parent, src.name))
+                if src.name in info.match and src.is_dir():
+                    self._watch_tree(info, src, src.name)
+
+    def _watch_tree(self, info: SaveInfo, top: Path, rel: str):
+        """ Watch a directory and the ones under it, except excluded ones. """
+        self._add(_Target(info, rel, top))
+        for sub, entry in tools.scantree(top, info._prune, rel):
+            if entry.is_dir():
+                self._add(_Target(info, sub, Path(entry.path)))
+
+    def _add(self, target: _Target):
+        try:
+            wd = self.inotify.add_watch(target.path, MASK)
+        except OSError as e:
+            if e.errno == errno.ENOSPC and not self._warned:
+                tools.eprint("Out of inotify watches, some files won't be " +
+                             "watched. Raise fs.inotify.max_user_watches.")
+                self._warned = True
+            elif e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.ENOSPC):
+                tools.eprint(f"Can't watch {target.path}: {e.strerror}")
+            return
+        targets = self._watches.setdefault(wd, [])
+        if target not in targets:
+            targets.append(target)
+
+    def _unwatch(self, info: SaveInfo, rel: str):
+        """ Stop watching a directory that moved away, and what's under it. """
+        prefix = rel + os.sep
+        for wd, targets in list(self._watches.items()):
+            targets[:] = [t for t in targets
+                          if t.info is not info or t.name
+                          or not (t.rel == rel or t.rel.startswith(prefix))]
+            if not targets:
+                del self._watches[wd]
+                try:
+                    self.inotify.rm_watch(wd)
+                except OSError:
+                    pass
+
+    def _handle(self, event: Event) -> bool:
+        """ Note what an event changed. Returns True if anything did. """
+        if event.mask & IN_Q_OVERFLOW:
+            self._rescan = True
+            return True
+        if event.mask & IN_IGNORED:
+            self._watches.pop(event.wd, None)
+            return False
+        is_dir = bool(event.mask & IN_ISDIR)
+        changed = False
+        for target in list(self._watches.get(event.wd, ())):
+            info = target.info
+            if target.name:
+                if event.name != target.name:
+                    continue
+                rel = target.name
+            elif event.name:
+                rel = target.rel + os.sep + event.name
+            else:
+                rel = target.rel
+            if info.matcher.match(rel, is_dir):
+                continue
+            self._dirty.setdefault(info, set()).add(rel)
+            changed = True
+            if not (is_dir and event.name):
+                continue
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(info, target.path.joinpath(event.name), rel)
+            elif event.mask & IN_MOVED_FROM:
+                self._unwatch(info, rel)
+        return changed
+
+    def flush(self):
+        """ Save again whatever changed since the last flush. """
+        if self._rescan:
+            self._rescan = False
+            self._dirty.clear()
+            for info in self.infos:
+                self._resave(info, None)
+            self.watch_all()
+            return
+        dirty, self._dirty = self._dirty, {}
+        for info, rels in dirty.items():
+            self._resave(info, rels)
+
+    @staticmethod
+    def _resave(info: SaveInfo, rels: Optional[set[str]]):
+        """ Save some paths of a config again, or all of it without `rels`. """
+        if rels is None:
+            rels = {Path(realpath(inc)).name for inc in info.include}
+        try:
+            info.resave(rels)
+            info.create_dotmatch()
+        except OSError as e:
+            tools.eprint(f"Failed to save {info.dotName}: {e}")
+            return
+        if info.updated or info.removed:
+            print(time.strftime("%H:%M:%S ") + info.summary(), flush=True)
+
+    def run(self):
+        """ Watch and save, until interrupted.
+
+            Blocks in the kernel while nothing happens, so an idle watcher
+            doesn't use any CPU.
+            """
+        self.watch_all()
+        first = last = 0.0
+        try:
+            while True:
+                timeout = None
+                if self._dirty or self._rescan:
+                    deadline = min(last + self.delay, first + self.maxDelay)
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        self.flush()
+                        continue
+                changed = False
+                for event in self.inotify.read(timeout):
+                    changed = self._handle(event) or changed
+                if changed:
+                    last = time.monotonic()
+                    if timeout is None:
+                        first = last
+        finally:
+            self.flush()
+            self.inotify.close()
+
+
+def watch(apps: Iterable[DotInfo],
+          name: str = "default",
+          user: str = config.userName,
+          saveDir: Union[str, Path] = config.saveDir,
+          delay: float = 1.0,
+          store: bool = config.useStore):
+    """ Save apps' configs, then save them again whenever they change.
+
+        Runs until interrupted.
+        """
+    infos: list[SaveInfo] = []
+    for app in apps:
+        info = SaveInfo(app, name, user, saveDir,
+                        store=Store(saveDir) if store else None)
+        _save(info)
+        print(info.summary(), flush=True)
+        infos.append(info)
+    index.update()
+    print(f"Watching {len(infos)} configs, press Ctrl-C to stop.",
+          flush=True)
+    Watcher(infos, delay).run()
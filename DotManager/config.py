@@ -42,20 +42,64 @@ confDir: Path = defaults.confDir
 saveDir: Path = defaults.saveDir
 """ Location where saved configs are stored. """
 
+trashDir: Path = defaults.trashDir
+""" Where removed configs wait to be deleted for good. """
+
+trashGrace: int = defaults.trashGrace
+""" How long removed configs are kept in the trash, in seconds.
+
+    Until then, `dot rm --undo` brings them back, default: a day. With 0,
+    they are deleted in the background right away, and can't be brought
+    back at all.
+    """
+
+generations: int = defaults.generations
+""" How many previous generations of each config are kept, 0 for none.
+
+    Each save makes a new generation, the previous one is moved to
+    `saveDir/.generations`. Files that didn't change are hardlinks shared
+    between generations, so they only take space once. Editing them in
+    place would change every generation, so configs that keep generations
+    are loaded as reflinks or copies, never as links.
+    """
+
 useLinks: bool = defaults.useLinks
 """ Whether to use hard copies or symlinks when loading.
 
-    Symlinks are recommended, as they will allow editing the config
-    without having to save it again.
+    Symlinks allow editing the config without having to save it again,
+    but only configs that don't keep generations, see `generations`, and
+    aren't in the object store, see `useStore`, can be linked to.
+    """
+
+useStore: bool = defaults.useStore
+""" Whether saved files are deduplicated through an object store.
+
+    File contents are then kept once in `saveDir/.objects`, named after
+    their hash, and saved configs are made of hardlinks to them. Blobs are
+    shared and read-only, so configs saved this way are loaded as reflinks
+    or copies, never as links.
+    """
+
+indexBackend: str = defaults.indexBackend
+""" How the index is stored, either "json" or "sqlite".
+
+    The JSON index is read whole at startup, which is fine until it holds
+    thousands of configs. The SQLite one answers lookups from the database
+    directly. It is created from the JSON index the first time it's used.
     """
 
 indexPath: Path = confDir.joinpath("index.json")
 """ Location of the index. """
 
-# Create missing directories
-if not xdgConfDir.exists():
-    xdgConfDir.mkdir()
-if not confDir.exists():
-    confDir.mkdir()
-if not saveDir.exists():
-    saveDir.mkdir()
+indexDbPath: Path = confDir.joinpath("index.db")
+""" Location of the index, when using the SQLite backend. """
+
+
+def ensure_dirs():
+    """ Create missing directories.
+
+        Not done at import time, so that commands that don't write anything
+        don't have to pay for it.
+        """
+    for directory in (xdgConfDir, confDir, saveDir):
+        directory.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import os
+import shutil
+import threading
+from typing import Union
+
+import DotManager.tools as tools
+
+# Errors meaning a strategy can't work for these files, rather than I/O errors
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+                errno.ENOSYS, errno.EBADF, errno.EPERM}
+
+STRATEGIES = ("reflink", "copy_file_range", "buffer")
+""" Ways to copy a file's content, from fastest to most portable. """
+
+
+class Copier:
+    """ Copies files with the fastest strategy the filesystems support.
+
+        - reflink: clone the extents with FICLONE, nothing is copied at all
+          (btrfs, XFS...).
+        - copy_file_range: the kernel copies the data, without it ever going
+          through user space.
+        - buffer: plain reads and writes through a large buffer.
+
+        A strategy that fails because it isn't supported is not tried again
+        by the same Copier. How many files each strategy copied is kept in
+        `stats`.
+        """
+
+    BUFSIZE = 1 << 20
+
+    def __init__(self):
+        self.disabled: set[str] = set()
+        self.stats: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def copy(self, src: Union[str, os.PathLike],
+             dst: Union[str, os.PathLike]) -> str:
+        """ Copy a file's content and metadata, like `shutil.copy2`.
+
+            Returns the strategy that was used.
+            """
+        strategy = self.copyfile(src, dst)
+        shutil.copystat(src, dst)
+        return strategy
+
+    def copyfile(self, src: Union[str, os.PathLike],
+                 dst: Union[str, os.PathLike]) -> str:
+        """ Copy a file's content only, like `shutil.copyfile`.
+
+            Returns the strategy that was used.
+            """
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fin, fout = fsrc.fileno(), fdst.fileno()
+            size = os.fstat(fin).st_size
+            for strategy in STRATEGIES:
+                if strategy in self.disabled:
+                    continue
+                try:
+                    getattr(self, "_" + strategy)(fin, fout, size)
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED or strategy == "buffer":
+                        raise
+                    self.disabled.add(strategy)
+                    # Start over, whatever was written is discarded
+                    os.ftruncate(fout, 0)
+                    os.lseek(fin, 0, os.SEEK_SET)
+                    os.lseek(fout, 0, os.SEEK_SET)
+                    continue
+                with self._lock:
+                    self.stats[strategy] = self.stats.get(strategy, 0) + 1
+                return strategy
+        raise AssertionError("unreachable")
+
+    @staticmethod
+    def _reflink(fin: int, fout: int, size: int):
+        tools.clone(fin, fout)
+
+    @staticmethod
+    def _copy_file_range(fin: int, fout: int, size: int):
+        if not hasattr(os, "copy_file_range"):
+            raise OSError(errno.ENOSYS, "copy_file_range is not available")
+        # Files in /proc and such report a size of 0, but aren't empty.
+        while os.copy_file_range(fin, fout, max(size, Copier.BUFSIZE)):
+            pass
+        # Some filesystems stop short instead of failing, copy them otherwise
+        if os.fstat(fout).st_size < os.fstat(fin).st_size:
+            raise OSError(errno.EOPNOTSUPP,
+                          "copy_file_range stopped before the end of file")
+
+    @staticmethod
+    def _buffer(fin: int, fout: int, size: int):
+        buf = bytearray(Copier.BUFSIZE)
+        view = memoryview(buf)
+        while n := os.readv(fin, [buf]):
+            written = 0
+            while written < n:
+                written += os.write(fout, view[written:n])
+
+    def summary(self) -> str:
+        """ Human-readable count of files copied with each strategy. """
+        return ", ".join(f"{n} {s}" for s, n in sorted(self.stats.items()))
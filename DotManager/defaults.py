@@ -55,3 +55,17 @@ saveDir = Path(confDir, saveDirName)
 
 # Wheter to use symlinks or copies
 useLinks = True
+
+# Whether saved configs share a deduplicated object store
+useStore = False
+
+# Trash for removed configs, and how long to keep them there, in seconds
+trashDirName = Path("trash")
+trashDir = Path(confDir, trashDirName)
+trashGrace = 24 * 60 * 60
+
+# How many previous generations of each config are kept
+generations = 10
+
+# Where the index is kept, either "json" or "sqlite"
+indexBackend = "json"
@@ -23,21 +23,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import fnmatch
-from importlib.resources import as_file
-from importlib.resources import files as data
 from json import load as deserialize
 from json import loads as deserializes
 from json import dump as serialize
 from json import dumps as serializes
 import json
+import marshal
 import os
 from pathlib import Path
 import re
-import shutil
-from typing import Union
+import stat
+import sys
+from typing import Optional, Union
 
 import DotManager.config as config
+from DotManager.ignore import Matcher
+import DotManager.pathindex as pathindex
+import DotManager.timings as timings
 import DotManager.tools as tools
 
 
@@ -50,7 +52,8 @@ class DotInfo:
         @exclude: Files to exclude. Supports globbing (think gitignore).
 
         @files: Full List of files in the current config to save.
-                Not yet implemented.
+                Excluded directories are pruned before being read, and the
+                result is cached until one of the walked directories changes.
         """
 
     def __init__(self,
@@ -61,8 +64,12 @@ class DotInfo:
         self.name:    str = Name
         self.command: str = Command
         self.include: list[str] = sorted([f.rstrip('/') for f in Include])
-        self.exclude: list[str] = sorted([f.rstrip('/') for f in Exclude])
-        self._files:  set[Path]
+        # Order matters, later patterns can re-include what earlier ones
+        # excluded. Trailing slashes matter too, they only match directories.
+        self.exclude: list[str] = list(Exclude)
+        self.matcher: Matcher = Matcher(self.exclude)
+        self._files:  Optional[set[Path]] = None
+        self._stamps: dict[str, int] = {}
 
         # TODO: Create custom exceptions
         regex = "^[a-zA-Z0-9_][a-zA-Z0-9_i\-]+$"
@@ -80,9 +87,64 @@ class DotInfo:
             raise KeyError(f"No config file to include for {self.name}")
 
     @property
-    def files(self):  # -> set[Path]:
-        """ TODO: Write a *fast* and *efficient* way to build this list. """
-        pass
+    def files(self) -> set[Path]:
+        """ Set of every file to save, exclusions already filtered out.
+
+            Each include is walked once with `os.scandir`, and excluded
+            directories are skipped without ever being listed.
+            The mtime of every directory that was read is kept along with the
+            result. As long as none of them changed, no file was added or
+            removed, so the cached set is returned as is.
+            """
+        if self._files is None or not self._is_fresh():
+            self._files, self._stamps = self._scan()
+        return set(self._files)
+
+    def _is_fresh(self) -> bool:
+        """ Check that no directory walked by `_scan` has changed since. """
+        for directory, mtime in self._stamps.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _scan(self) -> tuple[set[Path], dict[str, int]]:
+        """ Walk the includes, return the files and directories' mtimes.
+
+            Exclusions are checked against paths relative to the include's
+            parent directory, i.e. how they'll be laid out once saved.
+            """
+        files: set[Path] = set()
+        stamps: dict[str, int] = {}
+
+        def prune(relpath: str, entry: os.DirEntry) -> bool:
+            return self.matcher.match(relpath, entry.is_dir())
+
+        for inc in self.include:
+            root = tools.realpath(inc)
+            # Watching the parent tells us when the include itself appears.
+            try:
+                stamps[str(root.parent)] = root.parent.stat().st_mtime_ns
+                st = root.stat()
+            except OSError:
+                continue
+            if self.matcher.match(root.name, stat.S_ISDIR(st.st_mode)):
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                files.add(root)
+                continue
+            stamps[str(root)] = st.st_mtime_ns
+            for _, entry in tools.scantree(root, prune, root.name):
+                try:
+                    if entry.is_dir():
+                        stamps[entry.path] = entry.stat().st_mtime_ns
+                    else:
+                        files.add(Path(entry.path))
+                except OSError:
+                    continue
+        return files, stamps
 
     def __str__(self) -> str:
         ret = "Name:     {self.name}\n"
@@ -122,19 +184,18 @@ class DotInfo:
 
     def is_installed(self) -> bool:
         """ Returns true if the app is installed on the user's machine. """
-        return shutil.which(self.command) is not None
+        with timings.phase("which", self.name):
+            return pathindex.which(self.command) is not None
 
-    def is_excluded(self, path: Union[str, Path]) -> bool:
-        """ Return true if a file/dir's path contains an excluded expression.
+    def is_excluded(self, path: Union[str, Path], is_dir: bool = False) -> bool:
+        """ Return true if a file/dir's path is excluded, gitignore style.
 
-            This function doesn't check if the file exists, is valid, or
-            anything like that. It just checks the path string.
+            `path` is relative to where the includes are saved, e.g.
+            `.vim/plugged`. This function doesn't check if the file exists,
+            is valid, or anything like that. It just checks the path string,
+            so whether it's a directory has to be told.
             """
-        path = str(path)
-        return any(
-            fnmatch.fnmatchcase(path, "**" + exclude + "**")
-            for exclude in self.exclude
-        )
+        return self.matcher.excluded(str(path), is_dir)
 
     def get_file_path(self, includeElement: str) -> Path:
         """ Takes an element from a DotInfo's includes and get its abspath.
@@ -152,33 +213,125 @@ class DotInfo:
         return path
 
 
-# TODO: Cleanup this code, reduce boilerplate/copypastas.
-# TODO: Turn these into generators that use `yield`.
-def supported(confd: Union[str, Path] = config.confDir) -> dict[str, DotInfo]:
-    """ Return a dictionary of supported apps.
+class Registry:
+    """ Every dotinfo DotManager knows about, loaded once per process.
 
-        Keys are the names of the apps.
+        User dotinfos from `confd/dotinfo` come first, and take precedence
+        over the ones packaged with DotManager.
+        Parsed dotinfos are kept in a compiled cache, `confd/dotinfo.cache`,
+        along with the mtime and size of the file they come from. Only the
+        files that changed since the cache was written are parsed again.
+        The cache is written with `marshal`, which loads much faster than
+        JSON, and is thrown away when it comes from another version of the
+        cache or of Python.
         """
-    dots = {}
-    # TODO: Make a stack context manager
-    # TODO: Create exceptions,
-    #       Encapsulate these two loops in try blocks.
-    #       Move the error handling from the ifs to excepts.
-    for dotinfo in Path(confd).joinpath("dotinfo").glob("*.dotinfo"):
-        with open(dotinfo, 'rt') as jsonFile:
-            dot = DotInfo(**deserialize(jsonFile))
+
+    CACHE_VERSION = 1
+
+    def __init__(self, confd: Union[str, Path] = config.confDir):
+        self.confd = Path(confd)
+        self.cachePath = self.confd.joinpath("dotinfo.cache")
+        self._dots: Optional[dict[str, DotInfo]] = None
+
+    @property
+    def dots(self) -> dict[str, DotInfo]:
+        """ Supported apps, keys are the names of the apps. """
+        if self._dots is None:
+            self._dots = self._load()
+        return self._dots
+
+    def _sources(self) -> list[Path]:
+        """ Paths of every dotinfo, by order of precedence. """
+        # Slow to import, and only needed when the registry is loaded.
+        from importlib.resources import as_file
+        from importlib.resources import files as data
+
+        sources = sorted(self.confd.joinpath("dotinfo").glob("*.dotinfo"))
+        with as_file(data("DotManager").joinpath("dotinfo")) as path:
+            sources.extend(sorted(Path(path).glob("*.dotinfo")))
+        return sources
+
+    def _version(self) -> tuple:
+        """ What the cache has to be written by to be read back. """
+        return (self.CACHE_VERSION, marshal.version, sys.version_info[:2])
+
+    def _read_cache(self) -> dict[str, dict]:
+        try:
+            with open(self.cachePath, 'rb') as cache:
+                version, entries = marshal.load(cache)
+        except (OSError, EOFError, ValueError):
+            return {}
+        return entries if version == self._version() else {}
+
+    def _write_cache(self, cache: dict[str, dict]):
+        tmp = self.cachePath.with_name(self.cachePath.name + ".tmp")
+        try:
+            self.cachePath.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                marshal.dump((self._version(), cache), f)
+            os.replace(tmp, self.cachePath)
+        except OSError:
+            # Only a cache, DotManager works just as well without it.
+            pass
+
+    def _load(self) -> dict[str, DotInfo]:
+        old = self._read_cache()
+        cache: dict[str, dict] = {}
+        dots: dict[str, DotInfo] = {}
+        for source in self._sources():
+            try:
+                st = source.stat()
+            except OSError:
+                continue
+            key = str(source)
+            entry = old.get(key)
+            if (entry is None
+                    or entry.get("mtime") != st.st_mtime_ns
+                    or entry.get("size") != st.st_size):
+                try:
+                    with open(source, 'rt') as jsonFile:
+                        jsonDict = deserialize(jsonFile)
+                except (OSError, json.JSONDecodeError) as e:
+                    tools.eprint(f"Error while parsing {key}:\n  {e}")
+                    continue
+                entry = {"mtime": st.st_mtime_ns,
+                         "size": st.st_size,
+                         "dotinfo": jsonDict}
+            try:
+                dot = DotInfo.from_json_dict(entry["dotinfo"])
+            except (KeyError, NameError, TypeError) as e:
+                tools.eprint(f"Invalid dotinfo {key}:\n  {e}")
+                continue
+            cache[key] = entry
             if dot.name in dots:
                 tools.eprint(f"Error: duplicate dotinfo for {dot.name}.")
-                tools.eprint(f"Skipping {str(dotinfo)}.")
+                tools.eprint(f"Skipping {key}.")
+                continue
             dots[dot.name] = dot
+        if cache != old:
+            self._write_cache(cache)
+        return dots
 
-    with as_file(data("DotManager").joinpath("dotinfo")) as path:
-        # TODO: Try making my own context manager for this
-        #       It's probably more elegant, if it is possible
-        for f in path.glob("*.dotinfo"):
-            dot = DotInfo.from_json(f)
-            dots[dot.name] = dot
-    return dots
+
+_registries: dict[Path, Registry] = {}
+
+
+def registry(confd: Union[str, Path] = config.confDir) -> Registry:
+    """ Get the process-wide Registry for a config directory. """
+    confd = Path(confd)
+    if confd not in _registries:
+        _registries[confd] = Registry(confd)
+    return _registries[confd]
+
+
+# TODO: Turn these into generators that use `yield`.
+def supported(confd: Union[str, Path] = config.confDir) -> dict[str, DotInfo]:
+    """ Return a dictionary of supported apps.
+
+        Keys are the names of the apps.
+        """
+    with timings.phase("discovery"):
+        return dict(registry(confd).dots)
 
 
 def installed(confd: Union[str, Path] = config.confDir) -> dict[str, DotInfo]:
@@ -186,34 +339,6 @@ def installed(confd: Union[str, Path] = config.confDir) -> dict[str, DotInfo]:
 
         Keys are the names of the apps.
         """
-    dots = {}
-    # TODO: Make a stack context manager
-    # TODO: Create exceptions,
-    #       Encapsulate these two loops in try blocks.
-    #       Move the error handling from the ifs to excepts.
-    for dotinfo in Path(confd).joinpath("dotinfo").glob("*.dotinfo"):
-        with open(dotinfo, 'rt') as jsonFile:
-            dot = DotInfo(**deserialize(jsonFile))
-            if dot.name in dots:
-                tools.eprint(f"Error: duplicate dotinfo for {dot.name}.")
-                tools.eprint(f"Skipping {str(dotinfo)}.")
-            if not dot.is_installed():
-                continue
-            dots[dot.name] = dot
-
-    with as_file(data("DotManager").joinpath("dotinfo")) as path:
-        # TODO: Try making my own context manager for this
-        #       It's probably more elegant, if it is possible
-        for f in path.glob('*.dotinfo'):
-            try:
-                with open(f, "r") as jf:
-                    jsonDict = json.load(jf)
-            except json.JSONDecodeError as e:
-                tools.eprint(e.with_traceback)
-                continue
-            if shutil.which(jsonDict["Command"]) is None:
-                continue
-            if jsonDict["Name"] in dots:
-                continue
-            dots[jsonDict["Name"]] = DotInfo(**jsonDict)
-    return dots
+    with timings.phase("discovery"):
+        dots = registry(confd).dots
+    return {name: dot for name, dot in dots.items() if dot.is_installed()}
@@ -0,0 +1,153 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Cache of file hashes, so that files are only hashed once.
+
+    Hashes are remembered by device and inode, along with the size, mtime and
+    ctime of the file when it was hashed. Writing to a file changes its
+    ctime, which can't be set back, so a cached hash can't outlive the content
+    it was computed from.
+    """
+
+from concurrent.futures import ProcessPoolExecutor
+from json import JSONDecodeError
+from json import load as deserialize
+from json import dump as serialize
+import os
+from pathlib import Path
+import time
+from typing import Iterable, Optional, Union
+
+import DotManager.config as config
+import DotManager.tools as tools
+
+POOL_THRESHOLD = 16
+""" Fewer files than this are hashed in-process, a pool isn't worth it. """
+
+EXPIRY = 30 * 24 * 3600
+""" Hashes that weren't looked up for that long are dropped, in seconds. """
+
+
+class HashCache:
+    """ File hashes, kept in `confDir/hash.cache`.
+
+        Entries are `[size, mtime, ctime, hash, last used]`, keyed by
+        `device:inode`.
+        """
+
+    def __init__(self,
+                 cachePath: Union[str, Path] = config.confDir.joinpath(
+                     "hash.cache")):
+        self.cachePath = Path(cachePath)
+        self._now = int(time.time())
+        self._changed = False
+        try:
+            with open(self.cachePath, 'rt') as f:
+                self._entries: dict[str, list] = deserialize(f)
+        except (OSError, JSONDecodeError):
+            self._entries = {}
+
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}"
+
+    def get(self, st: os.stat_result) -> Optional[str]:
+        """ Cached hash of the file `st` comes from, if it's still valid. """
+        entry = self._entries.get(self._key(st))
+        if entry is None or entry[:3] != [st.st_size, st.st_mtime_ns,
+                                           st.st_ctime_ns]:
+            return None
+        if entry[4] != self._now:
+            entry[4] = self._now
+            self._changed = True
+        return entry[3]
+
+    def put(self, st: os.stat_result, digest: str):
+        """ Remember the hash of the file `st` comes from. """
+        self._entries[self._key(st)] = [st.st_size, st.st_mtime_ns,
+                                        st.st_ctime_ns, digest, self._now]
+        self._changed = True
+
+    def hash(self, paths: Iterable[Union[str, Path]],
+             jobs: Optional[int] = None) -> dict[Path, str]:
+        """ Hash files, using the cache for those that didn't change.
+
+            The others are hashed by a pool of `jobs` processes, one per CPU
+            by default. Files that can't be read are left out.
+            """
+        digests: dict[Path, str] = {}
+        todo: list[tuple[Path, os.stat_result]] = []
+        for path in map(Path, paths):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            digest = self.get(st)
+            if digest is None:
+                todo.append((path, st))
+            else:
+                digests[path] = digest
+
+        if len(todo) < POOL_THRESHOLD or jobs == 1:
+            results = map(_filehash, (path for path, _ in todo))
+            self._store(todo, results, digests)
+        else:
+            with ProcessPoolExecutor(jobs) as pool:
+                results = pool.map(_filehash, (path for path, _ in todo),
+                                   chunksize=max(1, len(todo) // 64))
+                self._store(todo, results, digests)
+        return digests
+
+    def _store(self, todo: list[tuple[Path, os.stat_result]],
+               results: Iterable[Optional[str]], digests: dict[Path, str]):
+        for (path, st), digest in zip(todo, results):
+            if digest is None:
+                continue
+            digests[path] = digest
+            self.put(st, digest)
+
+    def write(self):
+        """ Save the cache, if anything changed, dropping stale entries. """
+        if not self._changed:
+            return
+        entries = {key: entry for key, entry in self._entries.items()
+                   if self._now - entry[4] < EXPIRY}
+        tmp = self.cachePath.with_name(self.cachePath.name + ".tmp")
+        try:
+            self.cachePath.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'wt') as f:
+                serialize(entries, f)
+            os.replace(tmp, self.cachePath)
+        except OSError:
+            return
+        self._changed = False
+
+
+def _filehash(path: Path) -> Optional[str]:
+    """ `tools.filehash`, returning None for files that can't be read. """
+    try:
+        return tools.filehash(path)
+    except OSError:
+        return None
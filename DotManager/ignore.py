@@ -0,0 +1,151 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+from typing import Iterable, Optional
+
+
+def _glob(segment: str) -> str:
+    """ Translate a single path segment's wildcards to a regex. """
+    ret = ""
+    i, n = 0, len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == "*":
+            ret += "[^/]*"
+        elif c == "?":
+            ret += "[^/]"
+        elif c == "\\" and i < n:
+            ret += re.escape(segment[i])
+            i += 1
+        elif c == "[":
+            end = segment.find("]", i + 1 if segment[i:i + 1] in "!^" else i)
+            if end < 0:
+                ret += re.escape(c)
+                continue
+            chars = segment[i:end]
+            if chars[:1] in ("!", "^"):
+                chars = "^" + chars[1:]
+            ret += "[" + chars.replace("\\", "\\\\") + "]"
+            i = end + 1
+        else:
+            ret += re.escape(c)
+    return ret
+
+
+def translate(pattern: str) -> Optional[tuple[str, bool, bool]]:
+    """ Translate a gitignore pattern to (regex, negated, directories only).
+
+        Returns None for blank lines and comments.
+        """
+    if pattern.endswith("\\ "):
+        pattern = pattern[:-2].rstrip(" ") + " "
+    else:
+        pattern = pattern.rstrip(" ")
+    if not pattern or pattern.startswith("#"):
+        return None
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    elif pattern[:2] in ("\\!", "\\#"):
+        pattern = pattern[1:]
+    dirOnly = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # A slash anywhere but at the end anchors the pattern
+    anchored = "/" in pattern
+    segments = pattern.lstrip("/").split("/")
+    regex = ""
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            regex += ".+" if last else "(?:.*/)?"
+        else:
+            regex += _glob(segment) + ("" if last else "/")
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return regex, negated, dirOnly
+
+
+class Matcher:
+    """ Exclusion patterns, compiled once and matched with gitignore rules.
+
+        - A pattern without a slash matches at any depth, against whole
+          path components: `plugged` matches `a/plugged` but not
+          `unplugged.vim`.
+        - A pattern with a slash in it is anchored, `a/b` only matches
+          `a/b` itself.
+        - A trailing slash only matches directories.
+        - `*` and `?` don't cross slashes, `**` does.
+        - `!` re-includes what previous patterns excluded, the last
+          matching pattern wins.
+
+        Paths are relative and use forward slashes. All patterns are combined
+        in a single regex, so matching a path costs one regex match, however
+        many patterns there are.
+        """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: list[str] = list(patterns)
+        compiled = [(i, t) for i, t in
+                    ((i, translate(p)) for i, p in enumerate(self.patterns))
+                    if t is not None]
+        self._negated: dict[str, bool] = {f"p{i}": t[1] for i, t in compiled}
+        # Last pattern first: the first alternative that matches wins.
+        compiled.reverse()
+        self._dirs = self._compile(compiled)
+        self._files = self._compile([c for c in compiled if not c[1][2]])
+
+    @staticmethod
+    def _compile(compiled: list) -> Optional[re.Pattern]:
+        if not compiled:
+            return None
+        return re.compile("|".join(f"(?P<p{i}>{t[0]})" for i, t in compiled),
+                          re.DOTALL)
+
+    def __bool__(self) -> bool:
+        return self._dirs is not None
+
+    def match(self, path: str, is_dir: bool = False) -> bool:
+        """ Whether the last pattern matching `path` itself excludes it.
+
+            Parent directories aren't checked, walkers that prune excluded
+            directories don't need it.
+            """
+        regex = self._dirs if is_dir else self._files
+        if regex is None:
+            return False
+        m = regex.fullmatch(path)
+        return m is not None and not self._negated[m.lastgroup]
+
+    def excluded(self, path: str, is_dir: bool = False) -> bool:
+        """ Whether `path` is excluded, by itself or through a parent. """
+        if self._dirs is None:
+            return False
+        parts = path.strip("/").split("/")
+        for i in range(1, len(parts)):
+            if self.match("/".join(parts[:i]), True):
+                return True
+        return self.match("/".join(parts), is_dir)
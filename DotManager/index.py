@@ -24,20 +24,21 @@
 # SOFTWARE.
 
 import atexit
-from itertools import chain
+from collections import Counter
+import fcntl
 from json import dumps as to_string
 from json import load as deserialize
 from json import dump as serialize
 from json import JSONDecodeError
+import os
+from pathlib import Path
+import threading
+from typing import Optional, Union
 
 import DotManager.config as config
+import DotManager.timings as timings
 from DotManager.tools import eprint
 
-# TODO: Check out atExit, write the index when program closes.
-#       This will reduce I/O overhead when saving/deleting
-#       Multiple configurations.
-
-
 class __Index:
     """ Class provided to ease insertion and lookup in the index.
 
@@ -47,38 +48,49 @@ class __Index:
         """
 
     def __init__(self):
-        self._dict: dict[str, dict[str, list[str]]] = {}
+        # Config names are kept in sets, only the JSON file uses lists.
+        self._dict: dict[str, dict[str, set[str]]] = {}
+        # Reference counts of the apps and config names, all users included.
+        # An app or name is in the index as long as its count isn't zero,
+        # so that membership tests never have to go through self._dict.
+        self._apps: Counter[str] = Counter()
+        self._confs: Counter[str] = Counter()
+        # Changes made since the index was read, replayed when writing it.
+        self._journal: list[tuple[bool, str, str, str]] = []
+        # Saves may run in parallel, keep modifications in one piece.
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """ (Re)read the index file, a missing one is an empty index. """
         try:
             with open(config.indexPath, 'rt') as jsonIndex:
-                self._dict = deserialize(jsonIndex)
+                self._dict = {user: {app: set(names)
+                                     for app, names in apps.items()}
+                              for user, apps in deserialize(jsonIndex).items()}
+        except FileNotFoundError:
+            self._dict = {}
         except JSONDecodeError as e:
             eprint("Broken index !")
             eprint(e)
             exit(1)
-
-        # Fetch the users from the keys in self._dict
-        self._users: set[str] = set(self._dict)
-
-        # Fetch the apps for each user, including duplicates
-        self._apps: list[str] = []
-        for user in self._users:
-            self._apps.extend(self._dict[user])
-
-        # Fetch the config names for each saved app, all users included.
-        self._confs: list[str] = []
-        for user in self._users:
-            # Honestly, don't ask. I came up with this by accident.
-            # It's pretty fast though so guess I'll keep it.
-            self._confs.extend(chain.from_iterable(self._dict[user].values()))
+        self._apps.clear()
+        self._confs.clear()
+        for apps in self._dict.values():
+            self._apps.update(apps.keys())
+            for names in apps.values():
+                self._confs.update(names)
 
     def __str__(self) -> str:
-        return to_string(self._dict,
+        return to_string(self.__dict__,
                          indent=4,
                          sort_keys=True,
                          ensure_ascii=False)
 
     @property
-    def __dict__(self) -> dict: return self._dict.copy()
+    def __dict__(self) -> dict:
+        return {user: {app: sorted(names) for app, names in apps.items()}
+                for user, apps in self._dict.items()}
     """ Get a copy on the deserialized JSON index. """
 
     @property
@@ -90,7 +102,7 @@ class __Index:
     """ Get a set of all the configurations names saved in the index. """
 
     @property
-    def users(self) -> set[str]: return set(self._users)
+    def users(self) -> set[str]: return set(self._dict)
     """ Get a set of all the users registered in the index. """
 
     def has(self, element: str) -> bool:
@@ -98,62 +110,341 @@ class __Index:
 
             Doesn't differentiante users from confs or apps.
             """
-        return (element in self.apps
-                or element in self.confs
-                or element in self.users)
+        return (element in self._apps
+                or element in self._confs
+                or element in self._dict)
 
     def query(self,
                app: str,
                name: str = "default",
                user: str = config.userName) -> bool:
         """ Check if a specific config is in the index. """
-        if user not in self.users:
-            return False
-        if app not in self._dict[user]:
+        apps = self._dict.get(user)
+        if apps is None:
             return False
-        return name in self._dict[user][app]
+        names = apps.get(app)
+        return names is not None and name in names
+
+    @property
+    def dirty(self) -> bool: return len(self._journal) > 0
+    """ Whether the index has changes that aren't written yet. """
 
     def insert(self, app: str, name: str, user: str):
         """ Isert something in the index. """
-        if user not in self._dict:
-            self._dict[user] = {app: [name]}
-            self._users.add(user)
-        if app not in self._dict[user]:
-            self._dict[user][app] = [name]
-            self._apps.append(app)
-        if name not in self._dict[user][app]:
-            self._dict[user][app].append(name)
-            self._confs.append(name)
+        with self._lock:
+            if self._insert(app, name, user):
+                self._journal.append((True, app, name, user))
 
     def remove(self, app: str, name: str, user: str):
         """ Remove something from the index. """
+        with self._lock:
+            if self._remove(app, name, user):
+                self._journal.append((False, app, name, user))
+
+    def _insert(self, app: str, name: str, user: str) -> bool:
+        """ Insert without journaling, return whether anything changed. """
+        if self.query(app, name, user):
+            return False
+        apps = self._dict.setdefault(user, {})
+        if app not in apps:
+            apps[app] = set()
+            self._apps[app] += 1
+        apps[app].add(name)
+        self._confs[name] += 1
+        return True
+
+    def _remove(self, app: str, name: str, user: str) -> bool:
+        """ Remove without journaling, return whether anything changed. """
         if not self.query(app, name, user):
-            return
-        self._confs.remove(name)
-        self._dict[user][app].remove(name)
-        if len(self._dict[user][app]) < 1:
-            del self._dict[user][app]
-            self._apps.remove(app)
-        if len(self._dict[user]) < 1:
+            return False
+        apps = self._dict[user]
+        apps[app].discard(name)
+        self._decrement(self._confs, name)
+        if not apps[app]:
+            del apps[app]
+            self._decrement(self._apps, app)
+        if not apps:
             del self._dict[user]
-            self._users.remove(user)
+        return True
+
+    @staticmethod
+    def _decrement(counter: Counter, key: str):
+        """ Decrease a reference count, forgetting keys that reach zero. """
+        counter[key] -= 1
+        if counter[key] < 1:
+            del counter[key]
 
     def update(self):
         """ Update the index file.
 
             This action is performed automatically when closing DotManager.
+            Nothing is written unless the index was modified.
+
+            Other DotManager processes may have written the index since it
+            was read, so under an exclusive lock, the file is read again and
+            the changes made by this process are replayed on top of it.
+            The result goes to a temporary file that then replaces the index,
+            so that it can never be left half-written.
             """
-        with open(config.indexPath, 'wt') as jsonIndex:
-            serialize(self._dict,
+        with self._lock:
+            if not self.dirty:
+                return
+            config.ensure_dirs()
+            lockPath = config.indexPath.with_name(
+                config.indexPath.name + ".lock")
+            with open(lockPath, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    for inserted, app, name, user in self._journal:
+                        if inserted:
+                            self._insert(app, name, user)
+                        else:
+                            self._remove(app, name, user)
+                    self._write()
+                    self._journal.clear()
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self):
+        """ Atomically replace the index file with the current index. """
+        tmp = config.indexPath.with_name(config.indexPath.name + ".tmp")
+        with open(tmp, 'wt') as jsonIndex:
+            serialize(self.__dict__,
                       jsonIndex,
                       indent=4,
                       sort_keys=True,
                       ensure_ascii=False)
+            jsonIndex.flush()
+            os.fsync(jsonIndex.fileno())
+        os.replace(tmp, config.indexPath)
+        dirfd = os.open(config.indexPath.parent, os.O_RDONLY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
+
+
+class _SqliteIndex:
+    """ SQLite backed index, with the same interface as __Index.
+
+        Every config is a (user, app, name) row, with lookups by user, app or
+        name going through an SQL index. Nothing is loaded upfront, so the
+        startup cost doesn't grow with the number of saved configs.
+
+        Each change is committed right away, SQLite takes care of the
+        locking between concurrent DotManager processes. `update()` is there
+        for compatibility only.
+        """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS configs (
+            user TEXT NOT NULL,
+            app  TEXT NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (user, app, name)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS configs_app ON configs (app);
+        CREATE INDEX IF NOT EXISTS configs_name ON configs (name);
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """
+
+    def __init__(self, dbPath: Path, jsonPath: Optional[Path] = None):
+        import sqlite3
+
+        config.ensure_dirs()
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(dbPath,
+                                   isolation_level=None,
+                                   check_same_thread=False,
+                                   timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self._SCHEMA)
+        if jsonPath is not None:
+            self.migrate(jsonPath)
+
+    def migrate(self, jsonPath: Path) -> bool:
+        """ Import every config from a JSON index, unless it was done already.
+
+            The import and the flag recording it are committed in the same
+            transaction, so a crash in the middle leaves the database as if
+            nothing happened, and concurrent processes import it only once.
+            Returns whether anything was imported.
+            """
+        with self._lock:
+            # Only take the write lock the first time around
+            if self._migrated():
+                return False
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                migrated = self._migrated()
+                if not migrated:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO configs VALUES (?, ?, ?)",
+                        self._read_json(jsonPath))
+                self._db.execute(
+                    "INSERT OR IGNORE INTO meta VALUES ('migrated', ?)",
+                    (str(jsonPath),))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return not migrated
+
+    def _migrated(self) -> bool:
+        cursor = self._db.execute(
+            "SELECT EXISTS (SELECT 1 FROM meta WHERE key = 'migrated')")
+        return bool(cursor.fetchone()[0])
+
+    @staticmethod
+    def _read_json(jsonPath: Path) -> list[tuple[str, str, str]]:
+        """ Every config in a JSON index, as (user, app, name) rows. """
+        try:
+            with open(jsonPath, 'rt') as jsonIndex:
+                jsonDict: dict[str, dict[str, list[str]]] = \
+                    deserialize(jsonIndex)
+        except FileNotFoundError:
+            return []
+        except JSONDecodeError as e:
+            eprint("Broken index !")
+            eprint(e)
+            exit(1)
+        return [(user, app, name)
+                for user, apps in jsonDict.items()
+                for app, names in apps.items()
+                for name in names]
+
+    def _column(self, column: str) -> set[str]:
+        with self._lock:
+            cursor = self._db.execute(f"SELECT DISTINCT {column} FROM configs")
+            return {row[0] for row in cursor}
+
+    def _exists(self, where: str, *args: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                f"SELECT EXISTS (SELECT 1 FROM configs WHERE {where})", args)
+            return bool(cursor.fetchone()[0])
+
+    def __str__(self) -> str:
+        return to_string(self.__dict__,
+                         indent=4,
+                         sort_keys=True,
+                         ensure_ascii=False)
+
+    @property
+    def __dict__(self) -> dict:
+        ret: dict[str, dict[str, list[str]]] = {}
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT user, app, name FROM configs ORDER BY user, app, name")
+            for user, app, name in cursor:
+                ret.setdefault(user, {}).setdefault(app, []).append(name)
+        return ret
+    """ Get a copy on the index, the same way the JSON file is laid out. """
+
+    @property
+    def apps(self) -> set[str]: return self._column("app")
+    """ Get a set of all the apps registered in the index. """
+
+    @property
+    def confs(self) -> set[str]: return self._column("name")
+    """ Get a set of all the configurations names saved in the index. """
+
+    @property
+    def users(self) -> set[str]: return self._column("user")
+    """ Get a set of all the users registered in the index. """
+
+    @property
+    def dirty(self) -> bool: return False
+    """ Changes are committed as they come, there's never anything pending. """
+
+    def has(self, element: str) -> bool:
+        """ Check if `element` is in the index.
+
+            Doesn't differentiante users from confs or apps.
+            """
+        return (self._exists("user = ?", element)
+                or self._exists("app = ?", element)
+                or self._exists("name = ?", element))
+
+    def query(self,
+               app: str,
+               name: str = "default",
+               user: str = config.userName) -> bool:
+        """ Check if a specific config is in the index. """
+        return self._exists("user = ? AND app = ? AND name = ?",
+                            user, app, name)
+
+    def insert(self, app: str, name: str, user: str):
+        """ Isert something in the index. """
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO configs VALUES (?, ?, ?)",
+                             (user, app, name))
+
+    def remove(self, app: str, name: str, user: str):
+        """ Remove something from the index. """
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM configs WHERE user = ? AND app = ? AND name = ?",
+                (user, app, name))
+
+    def update(self):
+        """ Nothing to do, every change is already committed. """
+        pass
+
+
+_Backend = Union[__Index, _SqliteIndex]
+
+
+def _open() -> _Backend:
+    """ Open the index with the backend chosen in the config. """
+    if config.indexBackend == "sqlite":
+        return _SqliteIndex(config.indexDbPath, config.indexPath)
+    return __Index()
+
+
+class _LazyIndex:
+    """ Stand-in for the index, that only opens it when it's first used.
+
+        Commands that never look at the index don't have to read it.
+        """
+
+    def __init__(self):
+        self._index: Optional[_Backend] = None
+
+    def _get(self) -> _Backend:
+        if self._index is None:
+            self._index = _open()
+        return self._index
+
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+
+    def __str__(self) -> str:
+        return str(self._get())
+
+    @property
+    def __dict__(self) -> dict: return self._get().__dict__
+    """ Get a copy on the deserialized JSON index. """
+
+    @property
+    def loaded(self) -> bool: return self._index is not None
+    """ Whether the index was opened yet. """
+
+    def update(self):
+        """ Update the index, if it was ever opened. """
+        if self._index is not None:
+            with timings.phase("index.update"):
+                self._index.update()
 
 
-index = __Index()
+index = _LazyIndex()
 """ __Index() object containing information about saved configs.
 
+    The actual index is only opened on first use.
     Since an atexit is registered for this object's update() function, using any other
     instance of the __Index() won't work as a way to update DotManager's index.json.
     """
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Minimal Linux inotify bindings, through ctypes.
+
+    See inotify(7). Only what `dot watch` needs is there: adding and removing
+    watches, and reading events, waiting for them up to a timeout.
+    """
+
+import ctypes
+import errno
+import os
+import select
+import struct
+from typing import Iterator, NamedTuple, Optional, Union
+
+# Events, from <sys/inotify.h>
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+# Flags set by the kernel
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# Flags for inotify_add_watch
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+
+# Flags for inotify_init1
+IN_CLOEXEC = os.O_CLOEXEC
+IN_NONBLOCK = os.O_NONBLOCK
+
+_HEADER = struct.Struct("iIII")
+
+
+class Event(NamedTuple):
+    """ An inotify event. `name` is empty for events on the watch itself. """
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+def _libc() -> ctypes.CDLL:
+    libc = ctypes.CDLL(None, use_errno=True)
+    try:
+        libc.inotify_init1
+    except AttributeError:
+        raise OSError(errno.ENOSYS, "inotify is not available") from None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class Inotify:
+    """ An inotify instance, to be closed with `close()` or a `with` block. """
+
+    BUFSIZE = 64 * 1024
+
+    def __init__(self):
+        self._libc = _libc()
+        self.fd: int = self._check(self._libc.inotify_init1(IN_CLOEXEC))
+
+    @staticmethod
+    def _check(result: int, path: Optional[str] = None) -> int:
+        if result < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return result
+
+    def add_watch(self, path: Union[str, os.PathLike], mask: int) -> int:
+        """ Watch `path` for the events in `mask`, returning the wd.
+
+            Watching the same inode again returns the same wd, with its mask
+            replaced.
+            """
+        return self._check(
+            self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask),
+            os.fspath(path))
+
+    def rm_watch(self, wd: int):
+        """ Stop watching. An IN_IGNORED event is sent for `wd`. """
+        self._check(self._libc.inotify_rm_watch(self.fd, wd))
+
+    def read(self, timeout: Optional[float] = None) -> Iterator[Event]:
+        """ Events that are queued, waiting up to `timeout` seconds for some.
+
+            Without a timeout, waits for as long as it takes.
+            """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        data = os.read(self.fd, self.BUFSIZE)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _HEADER.unpack_from(data, offset)
+            offset += _HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            yield Event(wd, mask, cookie, os.fsdecode(name))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from json import JSONDecodeError
+from json import load as deserialize
+from json import dump as serialize
+import os
+from pathlib import Path
+import shutil
+from typing import Optional, Union
+
+import DotManager.config as config
+
+
+class PathIndex:
+    """ Index of the executables names found in the PATH directories.
+
+        Each directory is listed once, and every lookup is then answered from
+        memory, only checking the execute permission of the file it finds.
+        Listings are cached in `confDir/path.cache` along with the mtime of
+        the directory they come from, so a directory is only listed again
+        once something was added to or removed from it. Directories that
+        aren't in PATH anymore are dropped from the cache.
+        """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 cachePath: Union[str, Path] = config.confDir.joinpath(
+                     "path.cache")):
+        if path is None:
+            path = os.environ.get("PATH", os.defpath)
+        self.dirs: list[str] = list(dict.fromkeys(
+            d for d in path.split(os.pathsep) if d))
+        self.cachePath = Path(cachePath)
+        self._names: Optional[dict[str, set[str]]] = None
+
+    @property
+    def names(self) -> dict[str, set[str]]:
+        """ File names in each PATH directory. """
+        if self._names is None:
+            self._names = self._load()
+        return self._names
+
+    def _load(self) -> dict[str, set[str]]:
+        try:
+            with open(self.cachePath, 'rt') as f:
+                old: dict[str, dict] = deserialize(f)
+        except (OSError, JSONDecodeError):
+            old = {}
+        # Directories that left PATH, or are gone, are dropped
+        cache: dict[str, dict] = {}
+        names: dict[str, set[str]] = {}
+        for directory in self.dirs:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            entry = old.get(directory)
+            if entry is None or entry.get("mtime") != mtime:
+                try:
+                    entry = {"mtime": mtime, "names": os.listdir(directory)}
+                except OSError:
+                    continue
+            cache[directory] = entry
+            names[directory] = set(entry["names"])
+        if cache != old:
+            tmp = self.cachePath.with_name(self.cachePath.name + ".tmp")
+            try:
+                self.cachePath.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp, 'wt') as f:
+                    serialize(cache, f)
+                os.replace(tmp, self.cachePath)
+            except OSError:
+                pass
+        return names
+
+    def which(self, command: str) -> Optional[str]:
+        """ Drop-in replacement for `shutil.which`, using the index. """
+        if os.path.dirname(command):
+            return shutil.which(command)
+        for directory, names in self.names.items():
+            if command not in names:
+                continue
+            path = os.path.join(directory, command)
+            if os.access(path, os.X_OK) and not os.path.isdir(path):
+                return path
+        return None
+
+
+_index: Optional[PathIndex] = None
+
+
+def which(command: str) -> Optional[str]:
+    """ Look a command up in the process-wide PathIndex. """
+    global _index
+    if _index is None:
+        _index = PathIndex()
+    return _index.which(command)
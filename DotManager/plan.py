@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Plans of what a command is going to do, worked out before doing it.
+
+    Planning only reads: it stats, and hashes when it has to. A plan can be
+    printed as JSON to see what a command would do and how many bytes it
+    would copy, then carried out as is.
+    """
+
+import json
+from typing import Iterator, NamedTuple
+
+ACTIONS = ("wipe", "mkdir", "copy", "link", "touch", "skip", "delete")
+""" What can be done to a path:
+
+    - wipe: delete a directory that can't be updated in place.
+    - mkdir: create a directory, or update its metadata.
+    - copy: copy a file's content and metadata.
+    - link: put a file in place with a link to something that exists.
+    - touch: only copy a file's metadata, its content is the same.
+    - skip: leave a path alone, it's up to date.
+    - delete: remove what's at a path.
+    """
+
+
+class Action(NamedTuple):
+    """ One step of a plan. `size` is how many bytes it moves. """
+    kind: str
+    path: str
+    src: str = ""
+    size: int = 0
+
+
+class Plan:
+    """ Actions to carry out, in order, for one command on one config.
+
+        `manifest` holds the manifest entries of the files the actions are
+        about, by action path. For a save, that's the config's manifest once
+        the plan is carried out, and `previous` the one it replaces.
+        """
+
+    def __init__(self, command: str, target: str):
+        self.command = command
+        self.target = target
+        self.actions: list[Action] = []
+        self.previous: dict[str, dict] = {}
+        self.manifest: dict[str, dict] = {}
+        self.released: list[str] = []
+
+    def add(self, kind: str, path: str, src: str = "", size: int = 0):
+        if kind not in ACTIONS:
+            raise ValueError(f"Invalid action: '{kind}'")
+        self.actions.append(Action(kind, path, src, size))
+
+    def __iter__(self) -> Iterator[Action]:
+        return iter(self.actions)
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def totals(self) -> dict[str, dict[str, int]]:
+        """ How many actions of each kind there are, and their bytes. """
+        totals: dict[str, dict[str, int]] = {}
+        for action in self.actions:
+            total = totals.setdefault(action.kind, {"count": 0, "bytes": 0})
+            total["count"] += 1
+            total["bytes"] += action.size
+        return totals
+
+    def to_dict(self) -> dict:
+        return {"command": self.command,
+                "target": self.target,
+                "totals": self.totals(),
+                "actions": [a._asdict() for a in self.actions]}
+
+    def to_json(self) -> str:
+        """ The plan as a single line of JSON. """
+        return json.dumps(self.to_dict())
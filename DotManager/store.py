@@ -0,0 +1,124 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import os
+from pathlib import Path
+import shutil
+import stat
+import tempfile
+import time
+from typing import Iterable, Optional, Union
+
+from DotManager.copier import Copier
+import DotManager.tools as tools
+
+
+class Store:
+    """ Content-addressed object store, shared by every saved config.
+
+        Each file content is kept once, as a read-only blob named after its
+        SHA-256 hash. Saved configs are then made of hardlinks to these blobs,
+        so identical files across users, apps and config names only take
+        up space once. A blob that isn't linked anywhere anymore can be
+        safely removed, which is what `release` and `gc` do.
+        """
+
+    def __init__(self, saveDir: Union[str, Path]):
+        self.root = Path(saveDir).joinpath(".objects")
+        self.copier = Copier()
+
+    def path(self, digest: str) -> Path:
+        """ Location of the blob for a given hash. """
+        return self.root.joinpath(digest[:2], digest[2:])
+
+    def add(self, src: Union[str, Path],
+            digest: str = "",
+            copier: Optional[Copier] = None) -> str:
+        """ Store a file's content if it isn't already, and return its hash.
+
+            The hash can be provided by the caller if it's already known.
+            The content is copied with `copier`, or the store's own Copier.
+            """
+        digest = digest or tools.filehash(src)
+        blob = self.path(digest)
+        if blob.exists():
+            return digest
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=blob.parent, prefix=".tmp-")
+        os.close(fd)
+        try:
+            (copier or self.copier).copyfile(src, tmp)
+            # Blobs are shared, nobody gets to write them.
+            mode = os.stat(src).st_mode & 0o555 | 0o444
+            os.chmod(tmp, mode)
+            os.replace(tmp, blob)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest
+
+    def link(self, digest: str, dst: Union[str, Path]):
+        """ Materialise a blob at `dst`, through a hardlink if possible. """
+        blob = self.path(digest)
+        try:
+            os.link(blob, dst)
+        except OSError as e:
+            # Too many links, or a saveDir spread across filesystems
+            if e.errno not in (errno.EMLINK, errno.EXDEV, errno.EPERM):
+                raise
+            shutil.copy2(blob, dst)
+
+    def release(self, digests: Iterable[str]):
+        """ Remove the given blobs if no saved config links to them anymore. """
+        for digest in set(digests):
+            blob = self.path(digest)
+            try:
+                if os.stat(blob).st_nlink <= 1:
+                    os.unlink(blob)
+            except FileNotFoundError:
+                continue
+
+    def gc(self, grace: float = 60) -> int:
+        """ Remove every unreferenced blob, return how many were removed.
+
+            Blobs written in the last `grace` seconds are left alone, a save
+            may be about to link them.
+            """
+        removed = 0
+        if not self.root.is_dir():
+            return removed
+        cutoff = time.time() - grace
+        for _, entry in tools.scantree(self.root):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if entry.name.startswith(".tmp-") or st.st_mtime > cutoff:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_nlink <= 1:
+                os.unlink(entry.path)
+                removed += 1
+        return removed
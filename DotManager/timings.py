@@ -0,0 +1,152 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Per-phase timings, for when something is slow.
+
+    Code that might be worth measuring wraps itself in `phase()`:
+
+        with timings.phase("copy_conf", app) as p:
+            ...
+            p.count(files=n, bytes=size)
+
+    Nothing is measured unless `enable()` was called, in which case the wall
+    time and counters of each phase are added up per app. `report()` prints
+    them as a table, and with a trace file, each phase is also written to it
+    as a JSON line as soon as it ends.
+    """
+
+import json
+import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+enabled: bool = False
+""" Whether phases are measured at all. """
+
+_trace: Optional[TextIO] = None
+_totals: dict[tuple[str, str], dict] = {}
+_lock = threading.Lock()
+
+COUNTERS = ("files", "bytes", "excluded")
+""" Counters shown in the report, in order. """
+
+
+class _Phase:
+    """ A phase being measured. """
+
+    __slots__ = ("name", "app", "counters", "_start", "_wall")
+
+    def __init__(self, name: str, app: str):
+        self.name = name
+        self.app = app
+        self.counters: dict[str, int] = {}
+
+    def count(self, **counters: int):
+        """ Add to the phase's counters. """
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def __enter__(self) -> "_Phase":
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        _record(self, time.perf_counter() - self._start)
+        return False
+
+
+class _Disabled:
+    """ Stands in for a phase when timings are disabled, doing nothing. """
+
+    __slots__ = ()
+
+    def count(self, **counters: int):
+        pass
+
+    def __enter__(self) -> "_Disabled":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_DISABLED = _Disabled()
+
+
+def phase(name: str, app: str = ""):
+    """ Measure what happens in a `with` block, as phase `name` of `app`. """
+    if not enabled:
+        return _DISABLED
+    return _Phase(name, app)
+
+
+def _record(p: _Phase, seconds: float):
+    with _lock:
+        total = _totals.setdefault((p.app, p.name), {"seconds": 0.0,
+                                                     "calls": 0})
+        total["seconds"] += seconds
+        total["calls"] += 1
+        for key, value in p.counters.items():
+            total[key] = total.get(key, 0) + value
+        if _trace is not None:
+            line = {"time": p._wall, "app": p.app, "phase": p.name,
+                    "seconds": seconds,
+                    "thread": threading.current_thread().name}
+            line.update(p.counters)
+            _trace.write(json.dumps(line) + "\n")
+            _trace.flush()
+
+
+def enable(trace: Optional[str] = None):
+    """ Start measuring phases.
+
+        With `trace`, every phase is also written as a JSON line to that
+        file, or to stderr if it's "-".
+        """
+    global enabled, _trace
+    enabled = True
+    if trace == "-":
+        _trace = sys.stderr
+    elif trace:
+        _trace = open(trace, 'at', encoding="utf-8")
+
+
+def report(out: TextIO = sys.stderr):
+    """ Print the time and counters of every phase, per app. """
+    with _lock:
+        totals = sorted(_totals.items())
+    if not totals:
+        return
+    width = max(len("app"), *(len(app) for (app, _), _ in totals))
+    pwidth = max(len("phase"), *(len(name) for (_, name), _ in totals))
+    print(f"{'app':<{width}}  {'phase':<{pwidth}}  {'ms':>10}"
+          + "".join(f"  {c:>10}" for c in COUNTERS), file=out)
+    for (app, name), total in totals:
+        print(f"{app or '-':<{width}}  {name:<{pwidth}}  "
+              f"{total['seconds'] * 1000:10.1f}"
+              + "".join(f"  {total.get(c, ''):>10}" for c in COUNTERS),
+              file=out)
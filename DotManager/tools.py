@@ -23,20 +23,138 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import errno
+import hashlib
 import os
 import sys
 from pathlib import Path
-from typing import Union
+from typing import Callable, Iterator, Optional, Union
 
 def eprint(*args, **kwargs):
     """ Wrapper around print to write to stderr. """
     print(*args, file=sys.stderr, **kwargs)
 
+def expandpath(path: Union[str, os.PathLike]) -> Path:
+    """ Expand a path's environment variables and tilde (~), and return it as a
+        pathlib.Path object, without resolving symlinks.
+        """
+    expanded = str(path)
+    expanded = str(os.path.expandvars(expanded))
+    expanded = str(os.path.expanduser(expanded))
+    return Path(expanded)
+
+
 def realpath(path: Union[str, os.PathLike]) -> Path:
     """ Expand a path's environment variables and tilde (~), and return it as a
         pathlib.Path object.
         """
-    realpath = str(path)
-    realpath = str(os.path.expandvars(realpath))
-    realpath = str(os.path.expanduser(realpath))
-    return Path(realpath).resolve()
+    return expandpath(path).resolve()
+
+
+FICLONE = 0x40049409
+""" ioctl request number to clone a file's extents, see ioctl_ficlone(2). """
+
+
+def clone(fin: int, fout: int):
+    """ Make the file open as `fout` share the extents of the one open as
+        `fin`, replacing its content.
+
+        Only works on filesystems that support it (btrfs, XFS...), otherwise
+        raises an OSError.
+        """
+    import fcntl
+
+    fcntl.ioctl(fout, FICLONE, fin)
+
+
+def reflink(src: Union[str, os.PathLike], dst: Union[str, os.PathLike]):
+    """ Create `dst` as a copy-on-write clone of `src`.
+
+        Only works on filesystems that support it (btrfs, XFS...), otherwise
+        raises an OSError, and `dst` is not left behind.
+        """
+    with open(src, 'rb') as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            clone(fsrc.fileno(), fd)
+        except BaseException:
+            os.close(fd)
+            os.unlink(dst)
+            raise
+        os.close(fd)
+
+
+RENAME_EXCHANGE = 2
+""" renameat2 flag to swap two paths, see rename(2). """
+
+
+def exchange(a: Union[str, os.PathLike], b: Union[str, os.PathLike]):
+    """ Atomically swap two paths, which must both exist.
+
+        Uses renameat2 with RENAME_EXCHANGE, raises an OSError where it isn't
+        supported (non-Linux, old kernels or some filesystems).
+        """
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    if not hasattr(libc, "renameat2"):
+        raise OSError(errno.ENOSYS, "renameat2 is not available")
+    AT_FDCWD = -100
+    if libc.renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b),
+                      RENAME_EXCHANGE) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), os.fspath(a), None, os.fspath(b))
+
+
+def filehash(path: Union[str, os.PathLike]) -> str:
+    """ Return the hex SHA-256 digest of a file's content. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scantree(top: Union[str, os.PathLike],
+             prune: Optional[Callable[[str, os.DirEntry], bool]] = None,
+             prefix: str = "") -> Iterator[tuple[str, os.DirEntry]]:
+    """ Walk `top` with os.scandir, yielding (relpath, entry) for everything
+        under it, directories included.
+
+        `relpath` is the entry's path relative to `top`, prepended with
+        `prefix`. When `prune(relpath, entry)` returns True, the entry is not
+        yielded, and if it is a directory, nothing under it is ever read.
+        Symlinks to directories are followed, loops are not.
+        """
+    try:
+        st = os.stat(top)
+    except OSError:
+        return
+    seen: set[tuple[int, int]] = {(st.st_dev, st.st_ino)}
+    stack: list[tuple[str, str]] = [(str(top), prefix)]
+    while stack:
+        path, rel = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for entry in entries:
+            relpath = os.path.join(rel, entry.name) if rel else entry.name
+            if prune is not None and prune(relpath, entry):
+                continue
+            yield relpath, entry
+            try:
+                isDir = entry.is_dir()
+            except OSError:
+                continue
+            if not isDir:
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            stack.append((entry.path, relpath))
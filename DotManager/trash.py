@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Trash for removed configs.
+
+    Removing a config only renames its directory into the trash, which is
+    instant no matter how big it is. The actual deletion happens later, in a
+    detached process, once the grace period (`config.trashGrace`) is over.
+    Until then, the config can be restored.
+    """
+
+import errno
+import fcntl
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+from typing import Optional, Union
+
+import DotManager.config as config
+from DotManager.store import Store
+
+
+def _dirs(saveDir: Union[str, Path]) -> list[Path]:
+    """ Trash directories, the one used when the saveDir is elsewhere last. """
+    return [config.trashDir, Path(saveDir).joinpath(".trash")]
+
+
+def move(location: Path,
+         user: str, app: str, name: str,
+         saveDir: Union[str, Path] = config.saveDir,
+         generation: Optional[int] = None) -> Optional[Path]:
+    """ Move a saved config's directory to the trash.
+
+        A rename can't cross filesystems. If the saveDir isn't on the same one
+        as `config.trashDir`, the config goes to a trash inside the saveDir.
+        A description of the config is written next to it beforehand, so
+        that it can be restored, and its blobs released once it's deleted.
+        Previous generations of a config are given their number.
+        """
+    entry = f"{time.time_ns()}-{location.name}"
+    meta = {"user": user, "app": app, "name": name,
+            "saveDir": str(Path(saveDir).resolve()),
+            "time": time.time()}
+    if generation is not None:
+        meta["generation"] = generation
+    for trash in _dirs(saveDir):
+        trash.mkdir(parents=True, exist_ok=True)
+        target = trash.joinpath(entry)
+        with open(trash.joinpath(entry + ".json"), 'wt') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(location, target)
+        except OSError as e:
+            os.unlink(trash.joinpath(entry + ".json"))
+            if e.errno == errno.EXDEV:
+                continue
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        return target
+    return None
+
+
+def entries(saveDir: Union[str, Path] = config.saveDir) -> list[tuple[Path, dict]]:
+    """ List what's in the trash, as (description path, description). """
+    found: list[tuple[Path, dict]] = []
+    for trash in _dirs(saveDir):
+        try:
+            names = os.listdir(trash)
+        except FileNotFoundError:
+            continue
+        for n in sorted(names):
+            if not n.endswith(".json"):
+                continue
+            path = trash.joinpath(n)
+            try:
+                with open(path, 'rt') as f:
+                    found.append((path, json.load(f)))
+            except (OSError, json.JSONDecodeError):
+                continue
+    return found
+
+
+def restore(user: str, app: str, name: str,
+            saveDir: Union[str, Path] = config.saveDir) -> Optional[Path]:
+    """ Move the latest trashed copy of a config back to where it was.
+
+        The previous generations that were removed along with it are brought
+        back too. Returns its location, or None if it wasn't in the trash
+        anymore. The index is left to the caller.
+        """
+    from DotManager.commands.save import SaveInfo
+
+    info = SaveInfo(app, name, user, saveDir)
+    config.trashDir.mkdir(parents=True, exist_ok=True)
+    # Wait for any reclaim to be done, rather than race it for the config
+    with open(config.trashDir.joinpath(".lock"), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        found = [(path, meta) for path, meta in entries(saveDir)
+                 if (meta.get("user"), meta.get("app"), meta.get("name"))
+                 == (user, app, name)]
+        latest = [(path, meta) for path, meta in found
+                  if "generation" not in meta]
+        if not latest:
+            return None
+        path, meta = latest[-1]
+        if info.location.exists():
+            raise FileExistsError(errno.EEXIST, "Config exists",
+                                  str(info.location))
+        os.rename(path.with_suffix(""), info.location)
+        os.unlink(path)
+        for path, old in found:
+            if old.get("generation") is None or old["time"] < meta["time"]:
+                continue
+            target = info.generation_dir(old["generation"])
+            if target.exists():
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(path.with_suffix(""), target)
+            os.unlink(path)
+    return info.location
+
+
+def reclaim(grace: int = config.trashGrace,
+            saveDir: Union[str, Path] = config.saveDir) -> int:
+    """ Delete what's been in the trash for longer than `grace` seconds.
+
+        Only one process reclaims at a time, the others return right away.
+        The blobs of deleted configs are released, and the object stores
+        they were in are swept for any other unreferenced blob, see
+        `Store.gc`.
+        Returns the number of configs deleted.
+        """
+    config.trashDir.mkdir(parents=True, exist_ok=True)
+    with open(config.trashDir.joinpath(".lock"), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        deleted = 0
+        stores: set[str] = set()
+        now = time.time()
+        for path, meta in entries(saveDir):
+            if now - meta.get("time", 0) < grace:
+                continue
+            directory = path.with_suffix("")
+            blobs: list[str] = []
+            try:
+                with open(directory.joinpath(".dotmatch.json"), 'rt') as f:
+                    files = json.load(f).get("files", {})
+                blobs = [e["hash"] for e in files.values() if "hash" in e]
+            except (OSError, json.JSONDecodeError, AttributeError):
+                pass
+            shutil.rmtree(directory, ignore_errors=True)
+            os.unlink(path)
+            if blobs:
+                stores.add(meta.get("saveDir", str(saveDir)))
+                Store(meta.get("saveDir", saveDir)).release(blobs)
+            deleted += 1
+        for store in stores:
+            Store(store).gc()
+        return deleted
+
+
+def expired(grace: int = config.trashGrace,
+            saveDir: Union[str, Path] = config.saveDir) -> bool:
+    """ Whether anything in the trash is due for deletion. """
+    now = time.time()
+    return any(now - meta.get("time", 0) >= grace
+               for _, meta in entries(saveDir))
+
+
+def reclaim_in_background(grace: int = config.trashGrace,
+                          saveDir: Union[str, Path] = config.saveDir):
+    """ Run `reclaim` in a detached process, if there's anything to delete.
+
+        The process outlives DotManager, so the terminal is given back
+        right away.
+        """
+    if not expired(grace, saveDir):
+        return
+    # Make sure the child finds this very DotManager
+    env = dict(os.environ)
+    root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (root, env.get("PYTHONPATH")) if p)
+    subprocess.Popen([sys.executable, "-m", "DotManager.trash",
+                      str(grace), str(saveDir)],
+                     env=env,
+                     stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL,
+                     start_new_session=True,
+                     close_fds=True)
+
+
+if __name__ == "__main__":
+    reclaim(int(sys.argv[1]), sys.argv[2])
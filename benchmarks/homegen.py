@@ -0,0 +1,116 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Reproducible fake home directories, for benchmarks.
+
+    Every profile lays out the same app, `Bench`, whose dotinfo is written to
+    the fake home's DotManager config directory:
+
+    - small: a handful of files.
+    - vim:   a vim-like config, with a few dozen plugins in `plugged`.
+    - huge:  100k files, most of them deep in excluded `plugged` and
+             `node_modules` trees.
+
+    The same profile and seed always produce the exact same tree.
+
+    Usage: python benchmarks/homegen.py <profile> <home> [--seed N]
+    """
+
+import argparse
+import json
+import os
+from pathlib import Path
+import random
+
+APP = "Bench"
+
+DOTINFO = {
+    "Name": APP,
+    "Command": "sh",
+    "Include": ["~/.vim/", "~/.vimrc", "~/.config/bench"],
+    "Exclude": ["plugged/", "node_modules/"],
+}
+
+# Kept files, plugins, files per plugin, excluded node_modules files, depth
+PROFILES: dict[str, tuple[int, int, int, int, int]] = {
+    "small": (5, 0, 0, 0, 1),
+    "vim":   (200, 40, 120, 0, 3),
+    "huge":  (2000, 300, 200, 38000, 6),
+}
+
+
+def _write(path: Path, rng: random.Random, size: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(rng.randbytes(size))
+
+
+def _tree(root: Path, rng: random.Random, count: int, depth: int,
+          prefix: str = "f"):
+    """ Spread `count` files over a random tree at most `depth` deep. """
+    for i in range(count):
+        parts = [f"d{rng.randrange(8)}" for _ in range(rng.randrange(depth))]
+        # Mostly small text files, a few bigger ones.
+        size = rng.choice((64, 512, 2048, 8192)) \
+            if rng.random() < 0.995 else 1 << 18
+        _write(root.joinpath(*parts, f"{prefix}{i}.vim"), rng, size)
+
+
+def generate(home: Path, profile: str = "vim", seed: int = 0) -> dict:
+    """ Create a fake home in `home`, return a description of it. """
+    kept, plugins, perPlugin, modules, depth = PROFILES[profile]
+    rng = random.Random(f"{profile}-{seed}")
+    home = Path(home)
+
+    _write(home.joinpath(".vimrc"), rng, 4096)
+    _tree(home.joinpath(".vim"), rng, kept, depth)
+    _tree(home.joinpath(".config", "bench"), rng, max(1, kept // 10), depth)
+    for p in range(plugins):
+        _tree(home.joinpath(".vim", "plugged", f"plugin{p}"),
+              rng, perPlugin, depth)
+    if modules:
+        _tree(home.joinpath(".config", "bench", "node_modules"),
+              rng, modules, depth + 4, "m")
+
+    confd = home.joinpath(".config", "DotManager")
+    confd.joinpath("dotinfo").mkdir(parents=True, exist_ok=True)
+    confd.joinpath("dotinfo", "bench.dotinfo").write_text(
+        json.dumps(DOTINFO, indent=4))
+
+    files = sum(len(f) for _, _, f in os.walk(home))
+    return {"profile": profile, "seed": seed, "files": files,
+            "excluded": plugins * perPlugin + modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("profile", choices=sorted(PROFILES))
+    parser.add_argument("home", type=Path)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args()
+    print(json.dumps(generate(opts.home, opts.profile, opts.seed), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" DotManager benchmark suite.
+
+    For each profile, a fake home is generated (see homegen.py), then every
+    operation runs in its own fresh interpreter, in order, against that home:
+    `supported()`, `installed()`, a first save, an unchanged save, a load
+    into an empty home, `rm`, and a batch of index operations.
+
+    Each operation records its wall time, its read and write syscalls and
+    bytes (from /proc/self/io, which doesn't count any other syscall) and
+    the interpreter's peak RSS. With --strace, every syscall is counted too,
+    by name: stat, open, getdents and the like are what saves and loads
+    mostly make. Counts are those of the worker process, minus those of a
+    worker that does nothing, so interpreter startup isn't part of them.
+    strace slows everything down, so wall times of such runs should only be
+    compared with other --strace runs.
+    Results are written as JSON, along with the DotManager version and git
+    revision, and can be compared with a previous run.
+
+    Usage: python benchmarks/run.py [--profiles small,vim,huge] [--seed N]
+                                    [--output FILE] [--compare FILE]
+                                    [--strace]
+    """
+
+import argparse
+import json
+import os
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+OPERATIONS = ["supported", "installed", "save", "resave", "load", "rm",
+              "index"]
+
+INDEX_OPS = 10000
+
+
+def _io() -> dict[str, int]:
+    """ Syscall and byte counters of the current process, if available. """
+    try:
+        with open("/proc/self/io", 'rt') as f:
+            return {k: int(v) for k, v in
+                    (line.split(": ") for line in f.read().splitlines())}
+    except OSError:
+        return {}
+
+
+def worker(operation: str) -> dict:
+    """ Run one operation in this process, and measure it. """
+    import resource
+
+    sys.path.insert(0, str(ROOT))
+    import DotManager.config as config
+    config.ensure_dirs()
+
+    before = _io()
+    start = time.perf_counter()
+
+    if operation == "noop":
+        pass
+    elif operation == "supported":
+        import DotManager.dotinfo as dotinfo
+        dotinfo.supported()
+    elif operation == "installed":
+        import DotManager.dotinfo as dotinfo
+        dotinfo.installed()
+    elif operation in ("save", "resave"):
+        from DotManager.commands.save import save
+        import DotManager.dotinfo as dotinfo
+        save(dotinfo.supported()["Bench"], force=True)
+    elif operation == "load":
+        from DotManager.commands.load import load
+        load("Bench", force=True, mode="copy")
+    elif operation == "rm":
+        from DotManager.commands.rm import rm
+        rm("Bench", "default", force=True)
+    elif operation == "index":
+        from DotManager.index import index
+        for i in range(INDEX_OPS):
+            index.insert(f"app{i % 100}", f"conf{i}", f"user{i % 10}")
+        for i in range(INDEX_OPS):
+            index.query(f"app{i % 100}", f"conf{i}", f"user{i % 10}")
+            index.has(f"conf{i}")
+        for i in range(INDEX_OPS):
+            index.remove(f"app{i % 100}", f"conf{i}", f"user{i % 10}")
+        index.update()
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
+
+    wall = time.perf_counter() - start
+    after = _io()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "wall_s": wall,
+        "read_syscalls": after.get("syscr", 0) - before.get("syscr", 0),
+        "write_syscalls": after.get("syscw", 0) - before.get("syscw", 0),
+        "bytes_read": after.get("rchar", 0) - before.get("rchar", 0),
+        "bytes_written": after.get("wchar", 0) - before.get("wchar", 0),
+        "peak_rss_kb": usage.ru_maxrss,
+    }
+
+
+def _syscalls(path: Path) -> dict[str, int]:
+    """ Calls per syscall, from the summary written by `strace -c`. """
+    counts: dict[str, int] = {}
+    with open(path, 'rt') as f:
+        for line in f:
+            # % time, seconds, usecs/call, calls, [errors], syscall
+            fields = line.split()
+            if len(fields) < 5 or not fields[3].isdigit():
+                continue
+            if fields[-1] != "total":
+                counts[fields[-1]] = int(fields[3])
+    return counts
+
+
+def _worker(operation: str, env: dict, tmp: str,
+            strace: bool) -> dict:
+    """ Run one operation in a fresh interpreter, and get its measures. """
+    cmd = [sys.executable, __file__, "--worker", operation]
+    trace = Path(tmp, "strace.txt")
+    if strace:
+        cmd = ["strace", "-f", "-c", "-o", str(trace)] + cmd
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, check=True,
+                          text=True)
+    result = json.loads(proc.stdout.splitlines()[-1])
+    if strace:
+        result["syscalls"] = _syscalls(trace)
+    return result
+
+
+def run(profile: str, seed: int, strace: bool = False) -> dict:
+    """ Generate a fake home for `profile` and run every operation on it. """
+    from homegen import generate
+
+    results: dict = {}
+    with tempfile.TemporaryDirectory(prefix="dotbench-") as tmp:
+        home = Path(tmp, "home")
+        start = time.perf_counter()
+        results["home"] = generate(home, profile, seed)
+        results["home"]["generate_s"] = time.perf_counter() - start
+        fresh = Path(tmp, "fresh")
+        fresh.mkdir()
+        baseline: dict[str, int] = {}
+        for operation in (["noop"] if strace else []) + OPERATIONS:
+            env = dict(os.environ,
+                       HOME=str(fresh if operation == "load" else home),
+                       XDG_CONFIG_HOME=str(home.joinpath(".config")))
+            env.pop("XDG_USER_CONFIG_DIR", None)
+            result = _worker(operation, env, tmp, strace)
+            if operation == "noop":
+                baseline = result["syscalls"]
+                continue
+            if strace:
+                calls = {name: n - baseline.get(name, 0)
+                         for name, n in result["syscalls"].items()}
+                result["syscalls"] = {name: n for name, n in
+                                      sorted(calls.items()) if n > 0}
+                result["total_syscalls"] = sum(result["syscalls"].values())
+            results[operation] = result
+            print(f"{profile:>6} {operation:>9}: "
+                  f"{results[operation]['wall_s'] * 1000:10.1f} ms",
+                  file=sys.stderr)
+    return results
+
+
+def revision() -> str:
+    try:
+        return subprocess.run(["git", "-C", str(ROOT), "rev-parse", "HEAD"],
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(new: dict, old: dict):
+    """ Print how wall times changed since a previous run. """
+    if new.get("strace") != old.get("strace", False):
+        print("Only one of the runs used strace, wall times aren't "
+              "comparable.", file=sys.stderr)
+    for profile, ops in new["profiles"].items():
+        for operation in OPERATIONS:
+            before = old.get("profiles", {}).get(profile, {}).get(operation)
+            after = ops.get(operation)
+            if not before or not after or not before["wall_s"]:
+                continue
+            ratio = after["wall_s"] / before["wall_s"]
+            print(f"{profile:>6} {operation:>9}: {ratio:6.2f}x "
+                  f"({before['wall_s'] * 1000:.1f} -> "
+                  f"{after['wall_s'] * 1000:.1f} ms)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", default="small,vim,huge")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    parser.add_argument("--strace", action="store_true",
+                        help="count every syscall, by name, with strace")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.worker:
+        print(json.dumps(worker(opts.worker)))
+        return 0
+
+    sys.path.insert(0, str(ROOT))
+    from DotManager.defaults import version
+    report = {
+        "version": version,
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "strace": opts.strace,
+        "profiles": {p: run(p, opts.seed, opts.strace)
+                     for p in opts.profiles.split(",")},
+    }
+    text = json.dumps(report, indent=4)
+    if opts.output:
+        opts.output.write_text(text + "\n")
+    else:
+        print(text)
+    if opts.compare:
+        compare(report, json.loads(opts.compare.read_text()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
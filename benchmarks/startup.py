@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+# MIT License
+
+# Copyright (c) 2020 Ludovic Fernandez
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Cold-start latency of the `dot` entry point.
+
+    Runs trivial commands in fresh interpreters, against a throwaway config
+    directory, and reports the median wall time of each in milliseconds.
+    With `--max-ms`, exits with an error if any of them is slower than that,
+    so that it can be used as a regression check.
+
+    Usage: python benchmarks/startup.py [--runs N] [--max-ms MS] [--output FILE]
+    """
+
+import argparse
+import json
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = [
+    ["--version"],
+    ["show", "supported"],
+    ["show", "saved"],
+]
+
+
+def measure(args: list[str], env: dict[str, str], runs: int) -> float:
+    """ Median wall time of `dot <args>`, in milliseconds. """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(ROOT.joinpath("dot")), *args],
+                       env=env,
+                       stdout=subprocess.DEVNULL,
+                       check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--output", type=Path, default=None)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ,
+                   HOME=home,
+                   XDG_CONFIG_HOME=os.path.join(home, ".config"),
+                   PYTHONPATH=str(ROOT))
+        env.pop("XDG_USER_CONFIG_DIR", None)
+        # Interpreter alone, as a baseline
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+        results = {"python": (time.perf_counter() - start) * 1000}
+        for args in COMMANDS:
+            results["dot " + " ".join(args)] = measure(args, env, opts.runs)
+        created = sorted(str(p.relative_to(home))
+                         for p in Path(home).rglob("*"))
+
+    report = {"startup_ms": results, "created": created}
+    text = json.dumps(report, indent=4)
+    if opts.output:
+        opts.output.write_text(text + "\n")
+    print(text)
+
+    if opts.max_ms is not None:
+        slow = {k: v for k, v in results.items() if v > opts.max_ms}
+        if slow:
+            print(f"Slower than {opts.max_ms}ms: {', '.join(slow)}",
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+""" Shared fixtures: every test gets its own home, config dir and index. """
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+from typing import Optional
+
+import pytest
+
+# DotManager reads its paths from the environment when it's first imported,
+# so point them somewhere harmless before any test module imports it.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+_root = tempfile.mkdtemp(prefix="dotmanager-tests-")
+os.environ["HOME"] = _root
+os.environ["XDG_CONFIG_HOME"] = os.path.join(_root, ".config")
+os.environ.pop("XDG_USER_CONFIG_DIR", None)
+
+import DotManager.config as config  # noqa: E402
+from DotManager.dotinfo import DotInfo  # noqa: E402
+from DotManager.index import index  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def confDir(tmp_path: Path, monkeypatch) -> Path:
+    """ A fresh DotManager config dir, with an empty index. """
+    conf = tmp_path.joinpath("conf")
+    monkeypatch.setattr(config, "confDir", conf)
+    monkeypatch.setattr(config, "saveDir", conf.joinpath("saved"))
+    monkeypatch.setattr(config, "trashDir", conf.joinpath("trash"))
+    monkeypatch.setattr(config, "indexPath", conf.joinpath("index.json"))
+    monkeypatch.setattr(config, "indexDbPath", conf.joinpath("index.db"))
+    monkeypatch.setattr(index, "_index", None)
+    return conf
+
+
+@pytest.fixture
+def saveDir(confDir: Path) -> Path:
+    return confDir.joinpath("saved")
+
+
+@pytest.fixture
+def home(tmp_path: Path, monkeypatch) -> Path:
+    """ An empty home, `~` expands to it. """
+    home = tmp_path.joinpath("home")
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    return home
+
+
+def write(path: Path, content: str = "") -> Path:
+    """ Create a file along with its parents. """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+
+@pytest.fixture
+def vim(home: Path) -> DotInfo:
+    """ A vim-like app, with a few files and an excluded plugin tree. """
+    write(home.joinpath(".vimrc"), "set number\n")
+    write(home.joinpath(".vim", "colors", "dark.vim"), "hi Normal\n")
+    write(home.joinpath(".vim", "plugged", "fzf", "plugin.vim"), "fzf\n")
+    write(home.joinpath(".vim", "swap", "vimrc.swp"), "swap\n")
+    write(home.joinpath(".vim", "swap", "keep.swp"), "keep\n")
+    return DotInfo("Vim", "vim", ["~/.vim/", "~/.vimrc"],
+                   ["plugged", "*.swp", "!keep.swp"])
+
+
+def tree(root: Path) -> dict[str, Optional[str]]:
+    """ Everything under `root` by relative path, with the content of files
+        and None for directories.
+        """
+    return {str(p.relative_to(root)): None if p.is_dir() else p.read_text()
+            for p in sorted(root.rglob("*"))}
@@ -0,0 +1,81 @@
+""" Exporting saved configs to tar archives, and importing them back. """
+
+import io
+import json
+from pathlib import Path
+import tarfile
+
+import DotManager.trash as trash
+from DotManager.commands.archive import export_archive, import_archive
+from DotManager.commands.rm import rm
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.index import index
+from DotManager.store import Store
+
+CONFIGS = [("me", "Vim", "default"), ("me", "Vim", "work")]
+
+
+def save(vim, saveDir: Path, name: str) -> SaveInfo:
+    info = SaveInfo(vim, name, "me", saveDir, store=Store(saveDir))
+    _save(info)
+    return info
+
+
+def archive(saveDir: Path, configs=CONFIGS) -> io.BytesIO:
+    out = io.BytesIO()
+    export_archive(out, configs, saveDir=saveDir)
+    out.seek(0)
+    return out
+
+
+def test_imports_dont_link_to_skipped_configs(vim, home: Path,
+                                             saveDir: Path):
+    default, work = save(vim, saveDir, "default"), save(vim, saveDir, "work")
+    # Both configs link to the same blob, each keeps its own copy
+    exported = archive(saveDir)
+
+    home.joinpath(".vimrc").write_text("set nonumber\n")
+    save(vim, saveDir, "default")
+    assert rm("Vim", "work", "me", saveDir, force=True)
+    assert import_archive(exported, saveDir=saveDir) == 1
+    assert index.query("Vim", "work", "me")
+    assert work.location.joinpath(".vimrc").read_text() == "set number\n"
+    assert default.location.joinpath(".vimrc").read_text() == \
+        "set nonumber\n"
+
+
+def test_links_to_skipped_content_fail_the_config(vim, home: Path,
+                                                  saveDir: Path, capsys):
+    default, work = save(vim, saveDir, "default"), save(vim, saveDir, "work")
+    # Archives used to share link groups between configs
+    exported = io.BytesIO()
+    with tarfile.open(fileobj=exported, mode="w|") as tar:
+        data = json.dumps({"me": {"Vim": ["default", "work"]}}).encode()
+        member = tarfile.TarInfo("index.json")
+        member.size = len(data)
+        tar.addfile(member, io.BytesIO(data))
+        for info in (default, work):
+            tar.add(info.location, f"saved/{info.location.name}")
+    exported.seek(0)
+
+    home.joinpath(".vimrc").write_text("set nonumber\n")
+    save(vim, saveDir, "default")
+    assert rm("Vim", "work", "me", saveDir, force=True)
+    assert import_archive(exported, saveDir=saveDir) == 0
+    assert "export it again" in capsys.readouterr().err
+    assert not index.query("Vim", "work", "me")
+    assert not work.location.exists()
+
+
+def test_forced_imports_trash_what_they_replace(vim, home: Path,
+                                                saveDir: Path):
+    default = save(vim, saveDir, "default")
+    exported = archive(saveDir, CONFIGS[:1])
+    home.joinpath(".vimrc").write_text("set nonumber\n")
+    save(vim, saveDir, "default")
+
+    assert import_archive(exported, force=True, saveDir=saveDir) == 1
+    assert default.location.joinpath(".vimrc").read_text() == "set number\n"
+    trashed = [meta for _, meta in trash.entries(saveDir)
+               if meta["name"] == "default"]
+    assert len(trashed) == 1
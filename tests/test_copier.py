@@ -0,0 +1,28 @@
+""" Copy strategies. """
+
+import os
+from pathlib import Path
+
+import DotManager.copier as copier
+from DotManager.copier import Copier
+
+
+def test_short_copy_file_range_falls_back(tmp_path: Path, monkeypatch):
+    src = tmp_path.joinpath("src")
+    src.write_bytes(os.urandom(3 * Copier.BUFSIZE + 17))
+    dst = tmp_path.joinpath("dst")
+    calls = []
+
+    def short(fin: int, fout: int, count: int) -> int:
+        # Copies a first chunk, then pretends to have reached the end
+        calls.append(count)
+        if len(calls) > 1:
+            return 0
+        return os.write(fout, os.pread(fin, 1000, 0))
+
+    monkeypatch.setattr(copier.os, "copy_file_range", short, raising=False)
+    c = Copier()
+    c.disabled.add("reflink")
+    assert c.copyfile(src, dst) == "buffer"
+    assert dst.read_bytes() == src.read_bytes()
+    assert "copy_file_range" in c.disabled
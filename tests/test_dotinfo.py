@@ -0,0 +1,39 @@
+""" The dotinfo registry and its cache. """
+
+import json
+import marshal
+from pathlib import Path
+
+import DotManager.dotinfo as dotinfo
+from DotManager.dotinfo import Registry
+
+from conftest import write
+
+
+def _dotinfo(confDir: Path) -> Path:
+    return write(confDir.joinpath("dotinfo", "foo.dotinfo"), json.dumps(
+        {"Name": "Foo", "Command": "foo", "Include": ["~/.foorc"],
+         "Exclude": []}))
+
+
+def test_cached_dotinfos_are_not_parsed_again(confDir: Path, monkeypatch):
+    _dotinfo(confDir)
+    assert "Foo" in Registry(confDir).dots
+    version, entries = marshal.loads(
+        confDir.joinpath("dotinfo.cache").read_bytes())
+    assert version == Registry(confDir)._version()
+
+    def parse(*args, **kwargs):
+        raise AssertionError("a cached dotinfo was parsed again")
+
+    monkeypatch.setattr(dotinfo, "deserialize", parse)
+    assert Registry(confDir).dots["Foo"].include == ["~/.foorc"]
+
+
+def test_stale_caches_are_ignored(confDir: Path):
+    _dotinfo(confDir)
+    cache = confDir.joinpath("dotinfo.cache")
+    registry = Registry(confDir)
+    cache.write_bytes(marshal.dumps(((0,) + registry._version()[1:], {})))
+    assert "Foo" in registry.dots
+    assert marshal.loads(cache.read_bytes())[0] == registry._version()
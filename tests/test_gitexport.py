@@ -0,0 +1,86 @@
+""" Exporting saved configs to git. """
+
+from pathlib import Path
+import subprocess
+
+from DotManager.commands.gitexport import STATE, export_git, git_dir
+from DotManager.commands.save import SaveInfo, _save
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(["git", "-C", str(repo)] + list(args), check=True,
+                          stdout=subprocess.PIPE, text=True).stdout
+
+
+def files(repo: Path, rev: str = "HEAD") -> dict[str, str]:
+    """ Paths in a commit, and their mode. """
+    out = git(repo, "ls-tree", "-r", rev)
+    return {line.split("\t")[1]: line.split()[0] for line in out.splitlines()}
+
+
+def test_exports_are_incremental(vim, home: Path, saveDir: Path,
+                                 tmp_path: Path):
+    repo = tmp_path.joinpath("repo.git")
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    assert export_git(repo, saveDir=saveDir) == (1, 4)
+    first = git(repo, "rev-parse", "HEAD").strip()
+    assert set(files(repo)) == {"index.json", "me-Vim-default/.dotmatch.json",
+                                "me-Vim-default/.vimrc",
+                                "me-Vim-default/.vim/colors/dark.vim",
+                                "me-Vim-default/.vim/swap/keep.swp"}
+
+    assert export_git(repo, saveDir=saveDir) == (1, 0)
+    assert git(repo, "rev-parse", "HEAD").strip() == first
+
+    with open(home.joinpath(".vimrc"), 'a') as f:
+        f.write("set list\n")
+    home.joinpath(".vim", "swap", "keep.swp").unlink()
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    assert export_git(repo, saveDir=saveDir) == (1, 3)
+    changed = git(repo, "diff-tree", "--no-commit-id", "--name-status", "-r",
+                  first, "HEAD").splitlines()
+    assert sorted(changed) == ["D\tme-Vim-default/.vim/swap/keep.swp",
+                               "M\tme-Vim-default/.dotmatch.json",
+                               "M\tme-Vim-default/.vimrc"]
+    assert git(repo, "show", "HEAD:me-Vim-default/.vimrc") == \
+        "set number\nset list\n"
+
+
+def test_exports_keep_the_rest_of_the_branch(vim, home: Path, saveDir: Path,
+                                             tmp_path: Path):
+    repo = tmp_path.joinpath("repo")
+    repo.mkdir()
+    git(repo, "init", "--quiet")
+    repo.joinpath("README").write_text("mine\n")
+    git(repo, "add", "README")
+    git(repo, "-c", "user.name=me", "-c", "user.email=me@home",
+        "commit", "--quiet", "-m", "Mine")
+
+    for name in ("default", "work"):
+        _save(SaveInfo(vim, name, "me", saveDir))
+    export_git(repo, saveDir=saveDir)
+    # Forget what was exported, as if the branch had moved since
+    git_dir(repo).joinpath(STATE).unlink()
+    home.joinpath(".vim", "colors", "dark.vim").unlink()
+    _save(SaveInfo(vim, "work", "me", saveDir))
+    assert export_git(repo, name="work", saveDir=saveDir)[0] == 1
+
+    exported = files(repo)
+    assert "README" in exported
+    assert "me-Vim-default/.vim/colors/dark.vim" in exported
+    assert "me-Vim-work/.vim/colors/dark.vim" not in exported
+    assert "me-Vim-work/.vimrc" in exported
+    assert '"work"' in git(repo, "show", "HEAD:index.json")
+    assert '"default"' in git(repo, "show", "HEAD:index.json")
+
+
+def test_symlinks_are_exported_as_symlinks(vim, saveDir: Path,
+                                           tmp_path: Path):
+    repo = tmp_path.joinpath("repo.git")
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    info.location.joinpath(".vim", "current").symlink_to("colors/dark.vim")
+    export_git(repo, saveDir=saveDir)
+    assert files(repo)["me-Vim-default/.vim/current"] == "120000"
+    assert git(repo, "show", "HEAD:me-Vim-default/.vim/current") == \
+        "colors/dark.vim"
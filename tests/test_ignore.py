@@ -0,0 +1,84 @@
+""" Exclusions, matched with the rules of .gitignore files. """
+
+from pathlib import Path
+import shutil
+import subprocess
+
+import pytest
+
+from DotManager.ignore import Matcher
+
+# (patterns, path, is a directory, excluded)
+CASES = [
+    # Patterns without a slash match whole components, at any depth
+    (["plugged"], "plugged", True, True),
+    (["plugged"], ".vim/plugged", True, True),
+    (["plugged"], ".vim/unplugged.vim", False, False),
+    (["*.swp"], "a/b/x.swp", False, True),
+    (["?.txt"], "a.txt", False, True),
+    (["?.txt"], "ab.txt", False, False),
+    (["[abc].c"], "b.c", False, True),
+    (["[!abc].c"], "b.c", False, False),
+    # A slash anywhere but at the end anchors the pattern
+    (["/root.txt"], "root.txt", False, True),
+    (["/root.txt"], "a/root.txt", False, False),
+    (["a/b"], "a/b", False, True),
+    (["a/b"], "x/a/b", False, False),
+    # A trailing slash only matches directories
+    (["build/"], "build", True, True),
+    (["build/"], "build", False, False),
+    (["build/"], "src/build", True, True),
+    # ** crosses directories, * doesn't
+    (["**/cache"], "cache", True, True),
+    (["**/cache"], "x/y/cache", True, True),
+    (["logs/**"], "logs/a/b.log", False, True),
+    (["a/**/b"], "a/b", False, True),
+    (["a/**/b"], "a/x/y/b", False, True),
+    (["a/*/b"], "a/x/y/b", False, False),
+    # The last matching pattern wins
+    (["*.swp", "!keep.swp"], "a/keep.swp", False, False),
+    (["*.swp", "!keep.swp"], "a/x.swp", False, True),
+    (["!keep.swp", "*.swp"], "a/keep.swp", False, True),
+    (["*.log", "!important/*.log"], "important/a.log", False, False),
+    (["*.log", "!important/*.log"], "other/important/a.log", False, True),
+    # Nothing under an excluded directory can be included again
+    (["plugged", "!plugged/keep"], "plugged/keep", False, True),
+    (["plugged/", "!keep"], "a/plugged/keep", False, True),
+    (["build"], "build/out/a.o", False, True),
+    # Comments, escapes and trailing spaces
+    (["# comment"], "# comment", False, False),
+    (["\\#x"], "#x", False, True),
+    (["\\!x"], "!x", False, True),
+    (["foo  "], "foo", False, True),
+    (["foo\\ "], "foo ", False, True),
+]
+
+
+@pytest.mark.parametrize("patterns, path, is_dir, excluded", CASES)
+def test_matcher(patterns: list[str], path: str, is_dir: bool,
+                 excluded: bool):
+    assert Matcher(patterns).excluded(path, is_dir) is excluded
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_cases_agree_with_git(tmp_path: Path):
+    for i, (patterns, path, is_dir, excluded) in enumerate(CASES):
+        repo = tmp_path.joinpath(str(i))
+        repo.mkdir()
+        subprocess.run(["git", "init", "--quiet", str(repo)], check=True)
+        repo.joinpath(".gitignore").write_text("\n".join(patterns) + "\n")
+        target = repo.joinpath(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if is_dir:
+            target.mkdir()
+        else:
+            target.write_text("")
+        ignored = subprocess.run(["git", "-C", str(repo), "check-ignore",
+                                  "--quiet", path]).returncode == 0
+        assert ignored is excluded, (patterns, path, is_dir)
+
+
+def test_no_patterns():
+    matcher = Matcher(["", "# nothing"])
+    assert not matcher
+    assert not matcher.excluded("a/b", True)
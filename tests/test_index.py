@@ -0,0 +1,84 @@
+""" The JSON and SQLite indexes, and migrating from one to the other. """
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import DotManager.index as indexModule
+from DotManager.index import _SqliteIndex
+
+
+@pytest.fixture
+def jsonIndex(confDir: Path) -> Path:
+    path = confDir.joinpath("index.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"me": {"Vim": ["default", "work"]}}))
+    return path
+
+
+def test_json_index_is_imported_once(confDir: Path, jsonIndex: Path):
+    db = confDir.joinpath("index.db")
+    index = _SqliteIndex(db, jsonIndex)
+    assert index.query("Vim", "work", "me")
+    index.remove("Vim", "work", "me")
+    # Removed configs don't come back from the JSON index
+    assert not _SqliteIndex(db, jsonIndex).query("Vim", "work", "me")
+
+
+def test_interrupted_migration_is_done_again(confDir: Path, jsonIndex: Path,
+                                             monkeypatch):
+    db = confDir.joinpath("index.db")
+    # The database was created, but the process died before migrating
+    _SqliteIndex(db)
+
+    def crash(path: Path):
+        yield ("me", "Vim", "default")
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(_SqliteIndex, "_read_json", staticmethod(crash))
+        with pytest.raises(KeyboardInterrupt):
+            _SqliteIndex(db, jsonIndex)
+
+    index = _SqliteIndex(db, jsonIndex)
+    assert index.__dict__ == {"me": {"Vim": ["default", "work"]}}
+    assert not index.migrate(jsonIndex)
+
+
+def _handle():
+    """ An index as another DotManager process would have it. """
+    return getattr(indexModule, "__Index")()
+
+
+def test_concurrent_writers_keep_each_others_changes(confDir: Path,
+                                                      jsonIndex: Path):
+    first, second = _handle(), _handle()
+    first.insert("Zsh", "default", "me")
+    second.remove("Vim", "work", "me")
+    second.insert("Vim", "laptop", "you")
+    first.update()
+    second.update()
+    assert _handle().__dict__ == {"me": {"Vim": ["default"],
+                                         "Zsh": ["default"]},
+                                  "you": {"Vim": ["laptop"]}}
+
+
+def test_failed_write_keeps_the_old_index(confDir: Path, jsonIndex: Path,
+                                          monkeypatch):
+    before = jsonIndex.read_text()
+    index = _handle()
+    index.insert("Zsh", "default", "me")
+
+    def crash(*args):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "replace", crash)
+        with pytest.raises(KeyboardInterrupt):
+            index.update()
+    assert jsonIndex.read_text() == before
+    assert index.dirty
+    index.update()
+    assert _handle().query("Zsh", "default", "me")
@@ -0,0 +1,101 @@
+""" Loading saved configs back in place. """
+
+import os
+from pathlib import Path
+import stat
+
+import DotManager.config as config
+from DotManager.commands.load import load
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.store import Store
+
+
+def test_store_configs_load_as_private_copies(vim, home: Path,
+                                              saveDir: Path, tmp_path: Path,
+                                              monkeypatch):
+    for name in ("default", "work"):
+        _save(SaveInfo(vim, name, "me", saveDir, store=Store(saveDir)))
+    blob = saveDir.joinpath("me-Vim-work", ".vimrc")
+    assert blob.stat().st_nlink > 2
+
+    fresh = tmp_path.joinpath("fresh")
+    fresh.mkdir()
+    monkeypatch.setenv("HOME", str(fresh))
+    assert load("Vim", "default", "me", saveDir, mode="symlink")
+
+    vimrc = fresh.joinpath(".vimrc")
+    st = os.lstat(vimrc)
+    assert stat.S_ISREG(st.st_mode)
+    assert st.st_nlink == 1
+    assert st.st_mode & stat.S_IWUSR
+    with open(vimrc, 'a') as f:
+        f.write("set list\n")
+    assert blob.read_text() == "set number\n"
+
+
+def test_generations_keep_what_was_saved(vim, home: Path, saveDir: Path,
+                                         tmp_path: Path, monkeypatch):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    fresh = tmp_path.joinpath("fresh")
+    fresh.mkdir()
+    monkeypatch.setenv("HOME", str(fresh))
+    assert load("Vim", "default", "me", saveDir, mode="symlink")
+    vimrc = fresh.joinpath(".vimrc")
+    assert not vimrc.is_symlink()
+    assert not os.path.samefile(vimrc, info.location.joinpath(".vimrc"))
+
+    for line in ("v2\n", "v3\n"):
+        with open(vimrc, 'a') as f:
+            f.write(line)
+        _save(SaveInfo(vim, "default", "me", saveDir))
+    assert info.generation_dir(1).joinpath(".vimrc").read_text() == \
+        "set number\n"
+    assert info.generation_dir(2).joinpath(".vimrc").read_text() == \
+        "set number\nv2\n"
+    assert info.location.joinpath(".vimrc").read_text() == \
+        "set number\nv2\nv3\n"
+
+
+def test_load_over_a_file_where_a_directory_was_saved(vim, home: Path,
+                                                      saveDir: Path,
+                                                      tmp_path: Path,
+                                                      monkeypatch):
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    fresh = tmp_path.joinpath("fresh")
+    fresh.mkdir()
+    fresh.joinpath(".vim").write_text("x\n")
+    monkeypatch.setenv("HOME", str(fresh))
+
+    assert load("Vim", "default", "me", saveDir, force=True, mode="copy")
+    assert fresh.joinpath(".vim", "colors", "dark.vim").read_text() == \
+        "hi Normal\n"
+    assert fresh.joinpath(".vimrc").read_text() == "set number\n"
+
+
+def test_default_mode_follows_generations(vim, home: Path, saveDir: Path,
+                                          tmp_path: Path, monkeypatch,
+                                          capsys):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    fresh = tmp_path.joinpath("fresh")
+    fresh.mkdir()
+    monkeypatch.setenv("HOME", str(fresh))
+    vimrc = fresh.joinpath(".vimrc")
+
+    # Generations are kept: copies, without asking for links
+    assert load("Vim", "default", "me", saveDir)
+    assert not vimrc.is_symlink()
+    assert "can't be linked" not in capsys.readouterr().err
+    assert load("Vim", "default", "me", saveDir, mode="hardlink")
+    assert "can't be linked" in capsys.readouterr().err
+
+    monkeypatch.setattr(config, "generations", 0)
+    linked = tmp_path.joinpath("linked")
+    linked.mkdir()
+    monkeypatch.setenv("HOME", str(linked))
+    vimrc = linked.joinpath(".vimrc")
+    assert load("Vim", "default", "me", saveDir)
+    assert vimrc.is_symlink()
+    assert os.path.samefile(vimrc, info.location.joinpath(".vimrc"))
+    assert capsys.readouterr().err == ""
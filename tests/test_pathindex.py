@@ -0,0 +1,53 @@
+""" Finding installed apps through the cached PATH index. """
+
+import os
+from pathlib import Path
+
+import pytest
+
+from DotManager.pathindex import PathIndex
+
+from conftest import write
+
+
+def executable(path: Path) -> Path:
+    write(path, "#!/bin/sh\n")
+    path.chmod(0o755)
+    return path
+
+
+@pytest.fixture
+def bins(tmp_path: Path) -> tuple[Path, Path]:
+    a, b = tmp_path.joinpath("a"), tmp_path.joinpath("b")
+    executable(a.joinpath("vim"))
+    executable(b.joinpath("nvim"))
+    write(b.joinpath("notes"), "not a program\n")
+    return a, b
+
+
+def test_lookups_come_from_the_cache(bins, tmp_path: Path, monkeypatch):
+    a, b = bins
+    path = os.pathsep.join([str(a), str(b)])
+    cache = tmp_path.joinpath("path.cache")
+    assert PathIndex(path, cache).which("nvim") == str(b.joinpath("nvim"))
+    assert PathIndex(path, cache).which("notes") is None
+
+    def listdir(*args):
+        raise AssertionError("a cached directory was listed again")
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "listdir", listdir)
+        assert PathIndex(path, cache).which("vim") == str(a.joinpath("vim"))
+
+    # Adding a file changes the directory's mtime
+    executable(a.joinpath("nano"))
+    assert PathIndex(path, cache).which("nano") == str(a.joinpath("nano"))
+
+
+def test_directories_that_left_path_are_dropped(bins, tmp_path: Path):
+    a, b = bins
+    cache = tmp_path.joinpath("path.cache")
+    PathIndex(os.pathsep.join([str(a), str(b)]), cache).names
+    assert PathIndex(str(a), cache).which("nvim") is None
+    assert list(PathIndex(str(a), cache).names) == [str(a)]
+    assert str(b) not in cache.read_text()
@@ -0,0 +1,89 @@
+""" Planning: what commands would do, worked out without writing. """
+
+import os
+from pathlib import Path
+
+import pytest
+
+from DotManager.commands import load, rm
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.plan import Action, Plan
+
+from conftest import write
+
+
+def snapshot(root: Path) -> dict[str, tuple[int, int, int]]:
+    """ Everything under `root`, with its mtime, size and mode. """
+    return {str(p): (st.st_mtime_ns, st.st_size, st.st_mode)
+            for p in root.rglob("*") for st in [p.lstat()]}
+
+
+def test_plan_totals():
+    plan = Plan("save", "/saved")
+    plan.add("mkdir", "a")
+    plan.add("copy", "a/b", "/live/a/b", 3)
+    plan.add("copy", "a/c", "/live/a/c", 4)
+    plan.add("skip", "d", "/live/d", 5)
+    assert list(plan)[1] == Action("copy", "a/b", "/live/a/b", 3)
+    assert plan.totals() == {"mkdir": {"count": 1, "bytes": 0},
+                             "copy": {"count": 2, "bytes": 7},
+                             "skip": {"count": 1, "bytes": 5}}
+    assert plan.to_dict()["totals"] == plan.totals()
+    with pytest.raises(ValueError):
+        plan.add("move", "a")
+
+
+def test_save_plan(vim, home: Path, saveDir: Path, tmp_path: Path):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    before = snapshot(tmp_path)
+    plan = info.plan()
+    assert snapshot(tmp_path) == before
+    assert plan.totals() == {"mkdir": {"count": 3, "bytes": 0},
+                             "copy": {"count": 3, "bytes": 26}}
+
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    os.remove(home.joinpath(".vim", "colors", "dark.vim"))
+    with open(home.joinpath(".vimrc"), 'a') as f:
+        f.write("set list\n")
+    info = SaveInfo(vim, "default", "me", saveDir)
+    before = snapshot(tmp_path)
+    plan = info.plan()
+    assert snapshot(tmp_path) == before
+    assert plan.totals() == {"mkdir": {"count": 1, "bytes": 0},
+                             "skip": {"count": 3, "bytes": 5},
+                             "copy": {"count": 1, "bytes": 20},
+                             "delete": {"count": 1, "bytes": 10}}
+    assert [a.path for a in plan if a.kind == "delete"] == \
+        [".vim/colors/dark.vim"]
+
+
+def test_load_plan(vim, home: Path, saveDir: Path, tmp_path: Path,
+                   monkeypatch):
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    before = snapshot(tmp_path)
+    plan = load.plan("Vim", "default", "me", saveDir, mode="copy")
+    assert snapshot(tmp_path) == before
+    assert plan.totals() == {"skip": {"count": 6, "bytes": 26}}
+
+    fresh = tmp_path.joinpath("fresh")
+    write(fresh.joinpath(".vimrc"), "set nonumber\n")
+    monkeypatch.setenv("HOME", str(fresh))
+    before = snapshot(tmp_path)
+    plan = load.plan("Vim", "default", "me", saveDir, mode="copy")
+    assert snapshot(tmp_path) == before
+    assert plan.totals() == {"mkdir": {"count": 3, "bytes": 0},
+                             "copy": {"count": 3, "bytes": 26},
+                             "delete": {"count": 1, "bytes": 0}}
+    assert [a.path for a in plan if a.kind == "delete"] == \
+        [str(fresh.joinpath(".vimrc"))]
+
+
+def test_rm_plan(vim, saveDir: Path, tmp_path: Path):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    before = snapshot(tmp_path)
+    plan = rm.plan("Vim", "default", "me", saveDir)
+    assert snapshot(tmp_path) == before
+    size = 26 + info.dotmatch.stat().st_size
+    assert plan.totals() == {"delete": {"count": 1, "bytes": size}}
+    assert list(plan) == [Action("delete", str(info.location), size=size)]
@@ -0,0 +1,38 @@
+""" Removing configs, and bringing them back. """
+
+from pathlib import Path
+
+import pytest
+
+import DotManager.trash as trash
+from DotManager.commands.rm import rm, undo
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.index import index
+
+from conftest import tree
+
+
+def test_undo_right_after_rm(vim, saveDir: Path):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    saved = tree(info.location)
+
+    assert rm("Vim", "default", "me", saveDir, force=True)
+    assert not info.location.exists()
+    assert not index.query("Vim", "default", "me")
+
+    assert undo("Vim", "default", "me", saveDir)
+    assert index.query("Vim", "default", "me")
+    assert tree(info.location) == saved
+
+
+def test_failed_rm_keeps_the_index(vim, saveDir: Path, monkeypatch):
+    _save(SaveInfo(vim, "default", "me", saveDir))
+
+    def fail(*args, **kwargs):
+        raise PermissionError("no")
+
+    monkeypatch.setattr(trash, "move", fail)
+    with pytest.raises(PermissionError):
+        rm("Vim", "default", "me", saveDir, force=True)
+    assert index.query("Vim", "default", "me")
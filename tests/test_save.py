@@ -0,0 +1,240 @@
+""" Saving configs: filtering, staging and resuming. """
+
+import errno
+import os
+from pathlib import Path
+import shutil
+
+import pytest
+
+from conftest import tree, write
+
+from DotManager.commands.save import SaveInfo, _save, save_all, walk_shared
+from DotManager.dotinfo import DotInfo
+from DotManager.index import index
+from DotManager.tools import realpath
+import DotManager.tools as tools
+
+
+def test_filtered_copy_matches_copy_then_cleanup(vim, home: Path,
+                                                 saveDir: Path):
+    write(home.joinpath(".vim", "colors", "dark.vim~"), "old\n")
+    write(home.joinpath(".vim", "pack", "plugged", "plugin.vim"), "pack\n")
+    # Negation and anchoring came with the gitignore rules, the patterns
+    # that were there before have to keep matching the same paths.
+    app = DotInfo("Vim", "vim", vim.include, ["plugged", "*.swp", "*~"])
+    filtered = SaveInfo(app, "filtered", "me", saveDir)
+    filtered.copy_conf()
+
+    # What saves used to do: copy everything, then rglob the exclusions away
+    location = saveDir.joinpath("cleaned")
+    location.mkdir()
+    for inc in app.include:
+        src = realpath(inc)
+        dst = location.joinpath(src.name)
+        if src.is_file():
+            shutil.copy2(src, dst)
+        else:
+            shutil.copytree(src, dst)
+    for exc in app.exclude:
+        for item in sorted(location.rglob(exc)):
+            if item.is_file():
+                os.remove(item)
+            else:
+                shutil.rmtree(item)
+
+    saved = tree(filtered.location)
+    assert saved == tree(location)
+    assert saved[".vimrc"] == "set number\n"
+    assert saved[".vim/colors/dark.vim"] == "hi Normal\n"
+
+
+def test_resave_through_symlinks_to_the_save(vim, home: Path, saveDir: Path):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    # What loading as symlinks leaves in place
+    for name in (".vim", ".vimrc"):
+        shutil.rmtree(home.joinpath(name), ignore_errors=True)
+        home.joinpath(name).unlink(missing_ok=True)
+        home.joinpath(name).symlink_to(info.location.joinpath(name))
+    with open(home.joinpath(".vimrc"), 'a') as f:
+        f.write("set list\n")
+
+    info.resave({".vimrc"})
+    info.create_dotmatch()
+    assert info.updated == 1
+    assert home.joinpath(".vimrc").read_text() == "set number\nset list\n"
+    assert info.load_dotmatch()[".vimrc"]["size"] == 20
+    assert sorted(os.listdir(info.location)) == \
+        [".dotmatch.json", ".vim", ".vimrc"]
+
+
+def test_resume_an_interrupted_save(vim, home: Path, saveDir: Path,
+                                    monkeypatch):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    first = tree(info.location)
+    write(home.joinpath(".vim", "colors", "light.vim"), "hi Light\n")
+    with open(home.joinpath(".vimrc"), 'a') as f:
+        f.write("set list\n")
+
+    staged: list[str] = []
+    stage = SaveInfo._stage
+
+    def interrupted(self, src, dst, rel, entry, record):
+        if staged:
+            raise OSError(errno.EIO, "Interrupted")
+        stage(self, src, dst, rel, entry, record)
+        staged.append(rel)
+
+    with monkeypatch.context() as m:
+        m.setattr(SaveInfo, "_stage", interrupted)
+        with pytest.raises(OSError):
+            _save(SaveInfo(vim, "default", "me", saveDir))
+    assert tree(info.location) == first
+    assert info.journal.exists()
+
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info, resume=True)
+    assert info.updated == 1
+    saved = tree(info.location)
+    assert saved[".vimrc"] == "set number\nset list\n"
+    assert saved[".vim/colors/light.vim"] == "hi Light\n"
+    assert tree(info.generation_dir(1)) == first
+    assert not info.journal.exists()
+    assert not info.staging.exists()
+
+
+def test_failed_retire_is_retired_by_the_next_save(vim, home: Path,
+                                                   saveDir: Path,
+                                                   monkeypatch):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    first = tree(info.location)
+    with open(home.joinpath(".vimrc"), 'a') as f:
+        f.write("set list\n")
+
+    def fail(*args):
+        raise PermissionError(errno.EACCES, "Permission denied")
+
+    with monkeypatch.context() as m:
+        m.setattr(SaveInfo, "_retire", fail)
+        with pytest.raises(PermissionError):
+            _save(SaveInfo(vim, "default", "me", saveDir))
+    second = tree(info.location)
+    assert second[".vimrc"] == "set number\nset list\n"
+    assert index.query("Vim", "default", "me")
+
+    with open(home.joinpath(".vimrc"), 'a') as f:
+        f.write("set hlsearch\n")
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    assert [n for n, _ in info.history()] == [3, 2, 1]
+    assert tree(info.generation_dir(1)) == first
+    assert tree(info.generation_dir(2)) == second
+    assert not info.journal.exists()
+    assert not info.staging.exists()
+
+
+def test_saving_in_place_keeps_the_generation(vim, home: Path,
+                                              saveDir: Path):
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    write(home.joinpath(".vimrc"), "set nonumber\n")
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    info = SaveInfo(vim, "default", "me", saveDir)
+    info.manifest = info.load_dotmatch()
+    info.create_dotmatch()
+    assert info.read_dotmatch()["generation"] == 2
+
+
+def test_links_to_the_save_dont_reach_previous_generations(vim, home: Path,
+                                                           saveDir: Path):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    # What loading as links used to leave in place
+    shutil.rmtree(home.joinpath(".vim"))
+    home.joinpath(".vim").symlink_to(info.location.joinpath(".vim"))
+    home.joinpath(".vimrc").unlink()
+    os.link(info.location.joinpath(".vimrc"), home.joinpath(".vimrc"))
+
+    # Something changed, so that saving again makes a new generation
+    home.joinpath(".vim", "swap", "keep.swp").unlink()
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    for name in (".vimrc", ".vim/colors/dark.vim"):
+        with open(home.joinpath(name), 'a') as f:
+            f.write("edited\n")
+    previous = tree(info.generation_dir(1))
+    assert previous[".vimrc"] == "set number\n"
+    assert previous[".vim/colors/dark.vim"] == "hi Normal\n"
+    saved = tree(info.location)
+    assert saved[".vimrc"] == "set number\nedited\n"
+    assert saved[".vim/colors/dark.vim"] == "hi Normal\nedited\n"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_save_all_goes_on_after_a_failure(vim, home: Path, saveDir: Path,
+                                          monkeypatch, capsys, jobs: int):
+    write(home.joinpath(".zshrc"), "setopt autocd\n")
+    zsh = DotInfo("Zsh", "zsh", ["~/.zshrc"], [])
+    apply_staged = SaveInfo.apply_staged
+
+    def fail_vim(self, *args):
+        if self.dotName == "Vim":
+            raise PermissionError(errno.EACCES, "Permission denied")
+        return apply_staged(self, *args)
+
+    monkeypatch.setattr(SaveInfo, "apply_staged", fail_vim)
+    assert not save_all([vim, zsh], "default", "me", saveDir, force=True,
+                        jobs=jobs)
+    assert "Failed to save Vim" in capsys.readouterr().err
+    assert index.query("Zsh", "default", "me")
+    assert not index.query("Vim", "default", "me")
+
+
+def test_shared_includes_are_walked_once(vim, home: Path, saveDir: Path,
+                                         monkeypatch):
+    write(home.joinpath(".config", "nvim", "init.vim"), "set number\n")
+    nvim = DotInfo("Neovim", "nvim", ["~/.vim/", "~/.config/nvim"],
+                   ["colors", "*.swp"])
+    apps = [vim, nvim]
+
+    # What each config finds on its own
+    alone = {app.name: sorted(rel for _, rel, _ in
+                                 SaveInfo(app, "default", "me",
+                                          saveDir).walk())
+             for app in apps}
+    assert alone["Vim"] != alone["Neovim"]
+
+    tops: list[Path] = []
+    scantree = tools.scantree
+
+    def counting(top, *args, **kwargs):
+        tops.append(Path(top))
+        return scantree(top, *args, **kwargs)
+
+    monkeypatch.setattr(tools, "scantree", counting)
+    infos = [SaveInfo(app, "default", "me", saveDir) for app in apps]
+    walks = walk_shared(infos)
+    assert sorted(tops) == sorted({home.joinpath(".vim"),
+                                   home.joinpath(".config", "nvim")})
+    for app, info in zip(apps, infos):
+        assert sorted(rel for _, rel, _ in walks[info]) == alone[app.name]
+
+
+def test_unchanged_saves_keep_the_generation(vim, home: Path, saveDir: Path):
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    info = SaveInfo(vim, "default", "me", saveDir)
+    saved = info.read_dotmatch()
+    for _ in range(3):
+        info = SaveInfo(vim, "default", "me", saveDir)
+        _save(info)
+        assert (info.updated, info.removed) == (0, 0)
+    assert info.read_dotmatch() == saved
+    assert [n for n, _ in info.history()] == [1]
+    assert not info.staging.exists()
+    assert not info.journal.exists()
+
+    write(home.joinpath(".vimrc"), "set nonumber\n")
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    assert info.read_dotmatch()["generation"] == 2
+    assert [n for n, _ in info.history()] == [2, 1]
@@ -0,0 +1,39 @@
+""" Status: telling changed files from merely touched ones. """
+
+import os
+from pathlib import Path
+
+from conftest import write
+
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.commands.status import status
+from DotManager.hashcache import HashCache
+
+
+def test_status_hashes_files_whose_mtime_changed(vim, home: Path,
+                                                  saveDir: Path,
+                                                  tmp_path: Path, capsys):
+    _save(SaveInfo(vim, "default", "me", saveDir))
+    cache = HashCache(tmp_path.joinpath("hash.cache"))
+    assert status(vim, "default", "me", saveDir, cache=cache)
+    assert "up to date" in capsys.readouterr().out
+
+    # Same size, new mtime: only hashing tells them apart
+    vimrc = write(home.joinpath(".vimrc"), "set nonumb\n")
+    colors = home.joinpath(".vim", "colors", "dark.vim")
+    for path in vimrc, colors:
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    write(home.joinpath(".vim", "new.vim"), "new\n")
+
+    assert not status(vim, "default", "me", saveDir, diff=True, cache=cache)
+    out = capsys.readouterr().out
+    assert "  modified: .vimrc\n" in out
+    assert "  added:    .vim/new.vim\n" in out
+    assert "dark.vim" not in out
+    assert "--- a/.vimrc\n+++ b/.vimrc\n" in out
+    assert "-set number\n+set nonumb\n" in out
+
+    # The live files' hashes are cached for the next run
+    assert cache.get(vimrc.stat()) is not None
+    assert cache.get(colors.stat()) is not None
@@ -0,0 +1,49 @@
+""" The object store, and collecting the blobs nothing links to. """
+
+import os
+from pathlib import Path
+import time
+
+import DotManager.trash as trash
+from DotManager.commands.rm import rm
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.store import Store
+
+from conftest import write
+
+
+def blobs(store: Store) -> list[str]:
+    return sorted(str(p.relative_to(store.root))
+                  for p in store.root.rglob("*") if p.is_file())
+
+
+def test_gc_keeps_linked_and_recent_blobs(tmp_path: Path, saveDir: Path):
+    store = Store(saveDir)
+    linked = store.add(write(tmp_path.joinpath("linked"), "linked\n"))
+    store.link(linked, tmp_path.joinpath("link"))
+    recent = store.add(write(tmp_path.joinpath("recent"), "recent\n"))
+    orphan = store.add(write(tmp_path.joinpath("orphan"), "orphan\n"))
+    old = time.time() - 3600
+    for digest in (linked, orphan):
+        os.utime(store.path(digest), (old, old))
+
+    assert store.gc() == 1
+    assert not store.path(orphan).exists()
+    assert store.path(linked).exists()
+    assert store.path(recent).exists()
+    assert store.gc(grace=0) == 1
+    assert not store.path(recent).exists()
+
+
+def test_reclaim_collects_blobs(vim, tmp_path: Path, saveDir: Path):
+    _save(SaveInfo(vim, "default", "me", saveDir, store=Store(saveDir)))
+    store = Store(saveDir)
+    assert len(blobs(store)) == 3
+    # Left over by a save that was interrupted, say
+    orphan = store.add(write(tmp_path.joinpath("orphan"), "orphan\n"))
+    old = time.time() - 3600
+    os.utime(store.path(orphan), (old, old))
+
+    assert rm("Vim", "default", "me", saveDir, force=True)
+    assert trash.reclaim(0, saveDir) == 1
+    assert blobs(store) == []
@@ -0,0 +1,57 @@
+""" Watching: changes to live files are saved again, and only those. """
+
+import os
+from pathlib import Path
+import shutil
+
+from conftest import tree, write
+
+from DotManager.commands.save import SaveInfo, _save
+from DotManager.commands.watch import Watcher
+
+
+def _pump(watcher: Watcher) -> bool:
+    """ Handle the events that are already queued, then flush. """
+    changed = False
+    for event in watcher.inotify.read(0.2):
+        changed = watcher._handle(event) or changed
+    watcher.flush()
+    return changed
+
+
+def test_watcher_saves_changes_again(vim, home: Path, saveDir: Path,
+                                     capsys):
+    info = SaveInfo(vim, "default", "me", saveDir)
+    _save(info)
+    location = info.location
+    watcher = Watcher([info])
+    try:
+        watcher.watch_all()
+        write(home.joinpath(".vimrc"), "set nonumber\n")
+        write(home.joinpath(".vim", "colors", "light.vim"), "hi Light\n")
+        os.unlink(home.joinpath(".vim", "colors", "dark.vim"))
+        assert _pump(watcher)
+        assert "Vim" in capsys.readouterr().out
+
+        saved = tree(location)
+        assert saved[".vimrc"] == "set nonumber\n"
+        assert saved[".vim/colors/light.vim"] == "hi Light\n"
+        assert ".vim/colors/dark.vim" not in saved
+
+        # Excluded paths don't make anything dirty
+        write(home.joinpath(".vim", "plugged", "fzf", "plugin.vim"), "new\n")
+        write(home.joinpath(".vim", "swap", "vimrc.swp"), "new\n")
+        assert not _pump(watcher)
+
+        # Directories created later are watched too
+        write(home.joinpath(".vim", "after", "ftplugin", "c.vim"), "c\n")
+        _pump(watcher)
+        write(home.joinpath(".vim", "after", "ftplugin", "c.vim"), "cpp\n")
+        _pump(watcher)
+        assert tree(location)[".vim/after/ftplugin/c.vim"] == "cpp\n"
+
+        shutil.rmtree(home.joinpath(".vim", "after"))
+        _pump(watcher)
+        assert ".vim/after" not in tree(location)
+    finally:
+        watcher.inotify.close()